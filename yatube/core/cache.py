@@ -0,0 +1,149 @@
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .metrics import record_cache
+
+# Ключ общего счётчика статистики кеша в самом кеше
+STATS_KEY = 'cache-stats:{}'
+STATS_EVENTS = ('hits', 'misses', 'sets', 'deletes')
+# Локальные счётчики процесса сбрасываются в общий кеш раз в столько событий
+STATS_FLUSH_EVERY = 100
+_MISSING = object()
+
+
+class InstrumentedCache(BaseCache):
+    """Обёртка над настоящим бэкендом кеша, считающая попадания и промахи.
+
+    Настоящий бэкенд задаётся ключом INNER_BACKEND в настройках CACHES.
+    Счётчики копятся в процессе и периодически складываются
+    в общий кеш, поэтому отчёт `cache_health` видит все процессы.
+    """
+
+    def __init__(self, location, params):
+        params = dict(params)
+        inner_backend = params.pop('INNER_BACKEND')
+        super().__init__(params)
+        self._inner = import_string(inner_backend)(location, params)
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def inner(self):
+        """Настоящий бэкенд: обращения к нему не попадают в статистику."""
+        return self._inner
+
+    def _record(self, event, count=1):
+        if not count:
+            return
+        record_cache(event, count)
+        with self._stats_lock:
+            self._stats[event] += count
+            pending = sum(self._stats.values())
+        if pending >= STATS_FLUSH_EVERY:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Складывает локальные счётчики в общий кеш."""
+        with self._stats_lock:
+            stats, self._stats = self._stats, Counter()
+        for event, count in stats.items():
+            key = STATS_KEY.format(event)
+            try:
+                self._inner.incr(key, count)
+            except ValueError:
+                if not self._inner.add(key, count, None):
+                    self._inner.incr(key, count)
+
+    def stats(self):
+        """Счётчики из общего кеша вместе с ещё не сброшенными."""
+        shared = self._inner.get_many(
+            [STATS_KEY.format(event) for event in STATS_EVENTS]
+        )
+        with self._stats_lock:
+            local = dict(self._stats)
+        return {
+            event: shared.get(STATS_KEY.format(event), 0)
+            + local.get(event, 0)
+            for event in STATS_EVENTS
+        }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = Counter()
+        self._inner.delete_many(
+            [STATS_KEY.format(event) for event in STATS_EVENTS]
+        )
+
+    def make_key(self, key, version=None):
+        return self._inner.make_key(key, version=version)
+
+    def validate_key(self, key):
+        return self._inner.validate_key(key)
+
+    def get(self, key, default=None, version=None):
+        value = self._inner.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record('misses')
+            return default
+        self._record('hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._inner.get_many(keys, version=version)
+        self._record('hits', len(found))
+        self._record('misses', len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        return self._inner.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._inner.add(key, value, timeout, version=version)
+        if added:
+            self._record('sets')
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._record('sets')
+        return self._inner.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._record('sets', len(data))
+        return self._inner.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._inner.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._inner.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._inner.decr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._record('deletes')
+        return self._inner.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._record('deletes', len(keys))
+        return self._inner.delete_many(keys, version=version)
+
+    def clear(self):
+        return self._inner.clear()
+
+    def close(self, **kwargs):
+        return self._inner.close(**kwargs)
+
+
+def cache_stats(alias):
+    """Статистика алиаса кеша или None, если он не инструментирован."""
+    backend = caches[alias]
+    if isinstance(backend, InstrumentedCache):
+        return backend.stats()
+    return None
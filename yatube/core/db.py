@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import connections, router
+
+
+def tune_sqlite(sender, connection, **kwargs):
+    """Применяет settings.SQLITE_PRAGMAS к новому соединению sqlite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def bulk_batch_size(model, objs, batch_size):
+    """batch_size для bulk_create не больше, чем допускает СУБД.
+
+    Django 2.2 не ограничивает явно переданный batch_size,
+    а sqlite не принимает больше 500 строк в одном INSERT.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = model._meta.concrete_fields
+    limit = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    return min(batch_size, limit)
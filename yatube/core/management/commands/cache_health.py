@@ -0,0 +1,66 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import InstrumentedCache
+
+
+class Command(BaseCommand):
+    help = 'Проверяет доступность кешей и печатает долю попаданий'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после отчёта',
+        )
+
+    def check_alias(self, alias):
+        """Пробная запись, чтение и удаление; возвращает задержку в мс."""
+        backend = caches[alias]
+        # Служебная проверка не должна портить долю попаданий
+        backend = getattr(backend, 'inner', backend)
+        key = f'cache-health:{uuid.uuid4().hex}'
+        started = time.perf_counter()
+        backend.set(key, 'ok', 10)
+        value = backend.get(key)
+        backend.delete(key)
+        elapsed = (time.perf_counter() - started) * 1000
+        return value == 'ok', elapsed
+
+    def handle(self, *args, **options):
+        failed = []
+        for alias, config in settings.CACHES.items():
+            backend = caches[alias]
+            healthy, elapsed = self.check_alias(alias)
+            if not healthy:
+                failed.append(alias)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{alias}: {config.get("INNER_BACKEND", config["BACKEND"])}'
+            ))
+            self.stdout.write(
+                f'  адрес: {config.get("LOCATION") or "-"}, '
+                f'префикс: {config.get("KEY_PREFIX") or "-"}'
+            )
+            status = (
+                self.style.SUCCESS('доступен') if healthy
+                else self.style.ERROR('НЕДОСТУПЕН')
+            )
+            self.stdout.write(f'  {status}, запись/чтение: {elapsed:.2f} мс')
+            if not isinstance(backend, InstrumentedCache):
+                self.stdout.write('  статистика не собирается')
+                continue
+            stats = backend.stats()
+            lookups = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / lookups if lookups else 0
+            self.stdout.write(
+                f'  попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+                f'записей: {stats["sets"]}, удалений: {stats["deletes"]}, '
+                f'доля попаданий: {ratio:.1%}'
+            )
+            if options['reset']:
+                backend.reset_stats()
+        if failed:
+            raise CommandError('Недоступны кеши: ' + ', '.join(failed))
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import defaultdict
+
+# Счётчики по view, которые копятся в процессе и отдаются /metrics/
+METRIC_FIELDS = (
+    ('requests', 'counter', 'Число запросов'),
+    ('over_budget', 'counter', 'Запросы, превысившие бюджет SQL-запросов'),
+    ('queries', 'counter', 'Число SQL-запросов'),
+    ('db_seconds', 'counter', 'Время SQL-запросов, секунды'),
+    ('cache_hits', 'counter', 'Попадания в кеш'),
+    ('cache_misses', 'counter', 'Промахи кеша'),
+    ('response_seconds', 'counter', 'Время подготовки ответа, секунды'),
+)
+METRIC_PREFIX = 'yatube_view_'
+
+_local = threading.local()
+_totals = defaultdict(lambda: dict.fromkeys(
+    (name for name, *_ in METRIC_FIELDS), 0
+))
+_totals_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL, кеш и время ответа."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.response_seconds = 0.0
+        self._started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper: считает запросы и их время."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def finish(self):
+        self.response_seconds = time.perf_counter() - self._started
+
+
+def current_metrics():
+    """Замеры запроса, который обрабатывает текущий поток, или None."""
+    return getattr(_local, 'metrics', None)
+
+
+def start_request():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def finish_request():
+    metrics, _local.metrics = current_metrics(), None
+    if metrics is not None:
+        metrics.finish()
+    return metrics
+
+
+def record_cache(event, count=1):
+    """Учитывает обращение к кешу в замерах текущего запроса."""
+    metrics = current_metrics()
+    if metrics is None or not count:
+        return
+    if event == 'hits':
+        metrics.cache_hits += count
+    elif event == 'misses':
+        metrics.cache_misses += count
+
+
+def add_totals(view, metrics, over_budget):
+    """Складывает замеры запроса в счётчики процесса."""
+    with _totals_lock:
+        totals = _totals[view]
+        totals['requests'] += 1
+        totals['over_budget'] += over_budget
+        for name in (
+            'queries', 'db_seconds', 'cache_hits', 'cache_misses',
+            'response_seconds',
+        ):
+            totals[name] += getattr(metrics, name)
+
+
+def reset_totals():
+    with _totals_lock:
+        _totals.clear()
+
+
+def render_prometheus():
+    """Счётчики процесса в текстовом формате Prometheus."""
+    with _totals_lock:
+        totals = {view: dict(values) for view, values in _totals.items()}
+    lines = []
+    for name, kind, description in METRIC_FIELDS:
+        metric = METRIC_PREFIX + name
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for view, values in sorted(totals.items()):
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{metric}{{view="{label}"}} {values[name]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,60 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics as request_metrics
+
+logger = logging.getLogger('yatube.metrics')
+
+
+def query_budget(view):
+    """Сколько SQL-запросов допустимо для view (None - без ограничения)."""
+    return settings.QUERY_BUDGETS.get(view, settings.QUERY_BUDGET)
+
+
+class QueryBudgetMiddleware:
+    """Замеряет каждый запрос: число и время SQL, кеш, время ответа.
+
+    Замеры пишутся строкой в лог `yatube.metrics` и копятся в счётчиках
+    процесса, которые отдаёт /metrics/. Запрос, превысивший бюджет
+    SQL-запросов своего view (settings.QUERY_BUDGETS, иначе
+    settings.QUERY_BUDGET), логируется с уровнем WARNING.
+    В отличие от debug_toolbar работает и при DEBUG=False.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_METRICS:
+            return self.get_response(request)
+        metrics = request_metrics.start_request()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics)
+                    )
+                response = self.get_response(request)
+        finally:
+            request_metrics.finish_request()
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        budget = query_budget(view)
+        over_budget = budget is not None and metrics.queries > budget
+        request_metrics.add_totals(view, metrics, over_budget)
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            'view=%s method=%s status=%s queries=%d budget=%s db_ms=%.1f '
+            'cache_hits=%d cache_misses=%d response_ms=%.1f%s',
+            view, request.method, response.status_code, metrics.queries,
+            budget, metrics.db_seconds * 1000, metrics.cache_hits,
+            metrics.cache_misses, metrics.response_seconds * 1000,
+            ' over_budget' if over_budget else '',
+        )
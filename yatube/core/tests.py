@@ -1,4 +1,13 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .metrics import reset_totals
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +17,89 @@ class ViewTestClass(TestCase):
         # Проверьте, что используется шаблон core/404.html
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CacheHealthTestClass(TestCase):
+    def setUp(self):
+        caches['posts'].reset_stats()
+
+    def test_instrumented_cache_counts(self):
+        backend = caches['posts']
+        backend.set('key', 'value')
+        backend.get('key')
+        backend.get('missing')
+        backend.get_many(['key', 'missing'])
+        stats = backend.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['sets'], 1)
+
+    def test_aliases_use_own_prefixes(self):
+        caches['posts'].set('shared-key', 'posts')
+        self.assertIsNone(caches['default'].get('shared-key'))
+
+    def test_aliases_use_own_stores(self):
+        """clear() одного алиаса не стирает записи других."""
+        caches['posts'].set('kept-key', 'posts')
+        caches['thumbnails'].clear()
+        self.assertEqual(caches['posts'].get('kept-key'), 'posts')
+        self.assertEqual(
+            caches['thumbnails'].inner._max_entries,
+            settings.CACHE_MAX_ENTRIES['thumbnails'],
+        )
+
+    def test_cache_health_command(self):
+        caches['posts'].get('missing')
+        output = StringIO()
+        call_command('cache_health', '--reset', stdout=output)
+        self.assertIn('posts', output.getvalue())
+        self.assertIn('доля попаданий', output.getvalue())
+        self.assertEqual(caches['posts'].stats()['misses'], 0)
+
+
+class SqliteTuningTestClass(TestCase):
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Настройка только для sqlite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            busy_timeout = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+        self.assertEqual(busy_timeout, settings.SQLITE_BUSY_TIMEOUT * 1000)
+        # 1 - NORMAL
+        self.assertEqual(synchronous, 1)
+
+
+class QueryBudgetMiddlewareTestClass(TestCase):
+    def setUp(self):
+        caches['posts'].clear()
+        reset_totals()
+
+    def test_request_is_measured(self):
+        with self.assertLogs('yatube.metrics', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        line = logs.output[0]
+        self.assertIn('view=posts:index', line)
+        self.assertRegex(line, r'queries=[1-9]')
+        self.assertRegex(line, r'cache_misses=[1-9]')
+        self.assertNotIn('over_budget', line)
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_over_budget_is_warning(self):
+        with self.assertLogs('yatube.metrics', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('over_budget', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'yatube_view_requests{view="posts:index"} 1',
+            response.content.decode(),
+        )
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_endpoint_hidden(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
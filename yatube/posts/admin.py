@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Post, Group, Comment, Follow
+from .models import AuthorStats, Post, Group, Comment, Follow, Tag
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -17,6 +18,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по инвертированному индексу вместо LIKE '%...%'
+        if not search_term:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(pk__in=search_posts(search_term)), False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -25,6 +34,19 @@ class CommentAdmin(admin.ModelAdmin):
     search_fields = ('text',)
 
 
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ('author', 'posts_count', 'followers_count')
+    readonly_fields = ('posts_count', 'followers_count')
+    search_fields = ('author__username',)
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
 admin.site.register(Follow)
@@ -0,0 +1,285 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.routers import DefaultRouter
+
+from .cache import (
+    author_scope, feed_generations, group_scope, index_scope, tag_scope
+)
+from .exporting import EXPORT_FORMATS, EXPORTS, render_records
+from .importing import PostImporter, guess_format, read_records
+from .models import Comment, Follow, Group, Post
+from .serializers import (
+    CommentSerializer, FollowSerializer, GroupSerializer, PostSerializer
+)
+
+
+def post_version(post_id):
+    """Версия поста: сдвигается при правке и при каждом комментарии."""
+    versions = list(Post.objects.filter(
+        pk=post_id
+    ).values_list('updated', flat=True)[:1])
+    return versions or None
+
+
+def uploaded_images(files):
+    """Картинки для импорта из файлов запроса, по имени поля.
+
+    Каждый вызов отдаёт отдельную копию: импорт закрывает файлы
+    после пачки, а одна картинка может быть у нескольких записей.
+    """
+    def open_image(name):
+        upload = files.get(name)
+        if upload is None:
+            return None
+        upload.seek(0)
+        return ContentFile(upload.read(), name=upload.name)
+    return open_image
+
+
+class IsAuthorOrReadOnly(permissions.BasePermission):
+    """Менять и удалять запись может только её автор."""
+
+    def has_object_permission(self, request, view, obj):
+        return (
+            request.method in permissions.SAFE_METHODS
+            or obj.author == request.user
+        )
+
+
+class ConditionalMixin:
+    """ETag и If-None-Match для GET-запросов.
+
+    Если get_version() возвращает дешёвую версию данных (поколения
+    лент, версию поста), при совпадении ETag ответ 304 отдаётся
+    без выборки и сериализации. Иначе ETag считается по телу ответа:
+    это экономит трафик, но не работу сервера.
+    """
+
+    def get_version(self):
+        return None
+
+    def conditional(self, handler, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return handler(request, *args, **kwargs)
+        etag = quote_etag(hashlib.md5('|'.join(map(str, [
+            request.get_full_path(), request.accepted_media_type, *version,
+        ])).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+        if not response.has_header('ETag'):
+            response.render()
+            response['ETag'] = quote_etag(
+                hashlib.md5(response.content).hexdigest()
+            )
+        return get_conditional_response(
+            request, etag=response['ETag'], response=response
+        )
+
+
+class PostViewSet(ConditionalMixin, viewsets.ModelViewSet):
+    """Посты; ?group=<slug>, ?author=<username> и ?tag=<имя> сужают список."""
+    serializer_class = PostSerializer
+    permission_classes = (
+        permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly,
+    )
+
+    def get_queryset(self):
+        posts = Post.objects.select_related(
+            'author', 'group'
+        ).prefetch_related('tags')
+        group = self.request.query_params.get('group')
+        if group:
+            posts = posts.filter(group__slug=group)
+        author = self.request.query_params.get('author')
+        if author:
+            posts = posts.filter(author__username=author)
+        tag = self.request.query_params.get('tag')
+        if tag:
+            posts = posts.filter(tag_links__tag__name=tag)
+        return posts
+
+    def get_version(self):
+        if 'pk' in self.kwargs:
+            return post_version(self.kwargs['pk'])
+        params = self.request.query_params
+        scopes = [index_scope()]
+        if params.get('group'):
+            scopes.append(group_scope(params['group']))
+        if params.get('author'):
+            scopes.append(author_scope(params['author']))
+        if params.get('tag'):
+            scopes.append(tag_scope(params['tag']))
+        return feed_generations(scopes)
+
+    def perform_create(self, serializer):
+        # Пост и счётчики автора сохраняются одной транзакцией
+        with transaction.atomic():
+            serializer.save(author=self.request.user)
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def import_posts(self, request):
+        """Создаёт посты текущего пользователя пачкой.
+
+        Принимает JSON-массив записей или файл JSONL/CSV в поле `file`
+        (multipart); картинки записей передаются файлами под теми же
+        именами, что в поле `image` записи.
+        """
+        if isinstance(request.data, list):
+            records = enumerate(request.data, 1)
+        elif 'file' in request.FILES:
+            upload = request.FILES['file']
+            records = read_records(upload, guess_format(upload.name))
+        else:
+            return Response(
+                {'file': ['Нужен массив записей или файл JSONL/CSV']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        importer = PostImporter(
+            author=request.user,
+            open_image=uploaded_images(request.FILES),
+            limit=settings.IMPORT_MAX_RECORDS,
+        ).run(
+            (number, record if isinstance(record, dict) else None)
+            for number, record in records
+        )
+        return Response(
+            {'created': importer.created, 'errors': importer.errors},
+            status=(
+                status.HTTP_201_CREATED if importer.created
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+
+class CommentViewSet(ConditionalMixin, viewsets.ModelViewSet):
+    """Комментарии поста, от старых к новым."""
+    serializer_class = CommentSerializer
+    permission_classes = (
+        permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly,
+    )
+    cursor_ordering = ('pub_date', 'pk')
+
+    def get_post(self):
+        return get_object_or_404(Post, pk=self.kwargs['post_id'])
+
+    def get_queryset(self):
+        return Comment.objects.filter(
+            post_id=self.kwargs['post_id']
+        ).select_related('author')
+
+    def get_version(self):
+        if 'pk' in self.kwargs:
+            # Отдельный комментарий версии не имеет
+            return None
+        return post_version(self.kwargs['post_id'])
+
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user, post=self.get_post())
+
+
+class GroupViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Group.objects.all()
+    serializer_class = GroupSerializer
+    cursor_ordering = ('pk',)
+
+
+class FollowViewSet(ConditionalMixin,
+                    mixins.ListModelMixin,
+                    mixins.CreateModelMixin,
+                    mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    """Подписки текущего пользователя."""
+    serializer_class = FollowSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return Follow.objects.filter(
+            user=self.request.user, is_deleted=False
+        ).select_related('user', 'author')
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.instance, _ = Follow.objects.get_or_create(
+                user=self.request.user,
+                author=serializer.validated_data['author'],
+            )
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """Выгрузка своих постов, комментариев или подписок одним файлом.
+
+    Ответ отдаётся потоком (StreamingHttpResponse): записи читаются
+    из базы страницами, поэтому память не зависит от объёма данных.
+    Формат - ?output=jsonl (по умолчанию) или ?output=csv.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    lookup_field = 'kind'
+    lookup_value_regex = '|'.join(EXPORTS)
+
+    def list(self, request):
+        return Response({
+            kind: reverse(
+                'api:export-detail', args=(kind,), request=request
+            )
+            for kind in EXPORTS
+        })
+
+    def retrieve(self, request, kind):
+        output = request.query_params.get('output', 'jsonl')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'output': [f'Формат {output} не поддерживается']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        export = EXPORTS[kind]
+        response = StreamingHttpResponse(
+            render_records(export, export.records(request.user), output),
+            content_type=(
+                'text/csv' if output == 'csv' else 'application/x-ndjson'
+            ) + '; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{kind}.{output}"'
+        )
+        return response
+
+
+router = DefaultRouter()
+router.register('posts', PostViewSet, basename='post')
+router.register(
+    r'posts/(?P<post_id>\d+)/comments', CommentViewSet, basename='comment'
+)
+router.register('groups', GroupViewSet, basename='group')
+router.register('follow', FollowViewSet, basename='follow')
+router.register('export', ExportViewSet, basename='export')
@@ -0,0 +1,133 @@
+import math
+import random
+import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Follow, Group, Post
+
+# Ленты, которые замеряет benchmark_feeds: имя view -> имя адреса
+BENCHMARK_VIEWS = {
+    'index': 'posts:index',
+    'group_posts': 'posts:group_list',
+    'profile': 'posts:profile',
+    'post_detail': 'posts:post_detail',
+    'follow_index': 'posts:follow_index',
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def sample(queryset, rng, count):
+    """Случайные записи без ORDER BY RANDOM(): по случайным pk."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    return [
+        queryset.filter(
+            pk__gte=rng.randint(bounds['low'], bounds['high'])
+        ).order_by('pk').first()
+        for _ in range(count)
+    ]
+
+
+def targets(view, rng, count):
+    """Адреса для замера view и пользователь, от имени которого идём."""
+    if view == 'index':
+        return [(reverse('posts:index'), None)] * count
+    if view == 'group_posts':
+        return [
+            (reverse('posts:group_list', args=(group.slug,)), None)
+            for group in sample(Group.objects.all(), rng, count)
+        ]
+    if view == 'profile':
+        return [
+            (reverse('posts:profile', args=(post.author.username,)), None)
+            for post in sample(
+                Post.objects.select_related('author'), rng, count
+            )
+        ]
+    if view == 'post_detail':
+        return [
+            (reverse('posts:post_detail', args=(post.pk,)), None)
+            for post in sample(Post.objects.all(), rng, count)
+        ]
+    if view == 'follow_index':
+        return [
+            (reverse('posts:follow_index'), follow.user)
+            for follow in sample(
+                Follow.objects.select_related('user'), rng, count
+            )
+        ]
+    raise ValueError(f'Неизвестная лента {view}')
+
+
+def measure(view, samples=20, repeat=1, warm=False, seed=0):
+    """Замеряет время ответа и число запросов ленты.
+
+    Без `warm` перед каждым запросом кеш приложения posts
+    очищается, то есть замеряется построение страницы, а не её
+    чтение из кеша. Возвращает словарь с перцентилями времени
+    в миллисекундах и наибольшим числом SQL-запросов.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    cache = caches['posts']
+    latencies, queries = [], []
+    for url, user in targets(view, rng, samples):
+        if user is not None:
+            client.force_login(user)
+        for _ in range(repeat):
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: ответ {response.status_code}')
+            latencies.append(elapsed * 1000)
+            queries.append(len(captured))
+        if user is not None:
+            client.logout()
+    if not latencies:
+        return None
+    result = {
+        f'p{percent}': round(percentile(latencies, percent), 2)
+        for percent in PERCENTILES
+    }
+    result['queries'] = max(queries)
+    result['requests'] = len(latencies)
+    return result
+
+
+def regressions(results, baseline, tolerance):
+    """Сравнивает замеры с базовыми; возвращает список описаний."""
+    found = []
+    for view, result in results.items():
+        base = baseline.get(view)
+        if not result or not base:
+            continue
+        if result['queries'] > base['queries']:
+            found.append(
+                f'{view}: запросов {result["queries"]} '
+                f'вместо {base["queries"]}'
+            )
+        limit = base['p95'] * (1 + tolerance)
+        if result['p95'] > limit:
+            found.append(
+                f'{view}: p95 {result["p95"]} мс, '
+                f'допустимо {limit:.2f} мс'
+            )
+    return found
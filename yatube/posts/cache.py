@@ -0,0 +1,259 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Имя фрагмента {% cache %} карточки поста в posts/includes/post_list.html
+POST_CARD_FRAGMENT = 'post_card'
+FEED_GENERATION_KEY = 'feed:generation:{}'
+FEED_MODIFIED_KEY = 'feed:modified:{}'
+FEED_PAGE_KEY = 'feed:page:{}'
+COMMENTS_BLOCK_KEY = 'comments:{}:{}:{}'
+TIMELINE_PULL_KEY = 'timeline:pulled:{}'
+# Пауза между проверками, пока страницу пересчитывает другой процесс
+FEED_LOCK_POLL = 0.05
+
+
+def posts_cache():
+    """Кеш приложения posts со своим префиксом ключей."""
+    return caches[settings.POSTS_CACHE]
+
+
+def post_card_key(post_id, updated):
+    """Ключ кеша карточки поста определённой версии."""
+    return make_template_fragment_key(
+        POST_CARD_FRAGMENT, [post_id, updated.timestamp()]
+    )
+
+
+def forget_post_card(post_id, updated):
+    """Удаляет из кеша карточку поста указанной версии.
+
+    Как и bump_feeds, удаляет сразу и ещё раз после коммита.
+    """
+    if updated is not None:
+        key = post_card_key(post_id, updated)
+        _now_and_on_commit(lambda: posts_cache().delete(key))
+
+
+def _now_and_on_commit(callback):
+    callback()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(callback)
+
+
+def comments_block_key(post_id, updated, cursor):
+    """Ключ кеша страницы комментариев поста определённой версии.
+
+    Версия поста сдвигается при каждом новом или удалённом
+    комментарии, поэтому старые блоки просто перестают читаться.
+    """
+    cursor = hashlib.md5((cursor or '').encode()).hexdigest()
+    return COMMENTS_BLOCK_KEY.format(post_id, updated.timestamp(), cursor)
+
+
+def timeline_pull_due(user_id):
+    """Пора ли догружать в ленту пользователя посты популярных авторов.
+
+    Не чаще раза в TIMELINE_PULL_INTERVAL секунд: отметка ставится
+    атомарным add, так что из параллельных запросов догружает один.
+    """
+    return posts_cache().add(
+        TIMELINE_PULL_KEY.format(user_id), 1, settings.TIMELINE_PULL_INTERVAL
+    )
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def tag_scope(name):
+    return f'tag:{name}'
+
+
+def scope_key(template, scope):
+    """Ключ кеша области ленты: `template` с хешем области.
+
+    В области попадают имена тегов и пользователей, а пробелы,
+    управляющие символы и длинные ключи memcached не принимает.
+    """
+    return template.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def _new_generation():
+    # Время в мс, а не 1: после вытеснения счётчика из кеша
+    # новое поколение не совпадёт со старыми страницами
+    return int(time.time() * 1000)
+
+
+def feed_versions(scopes):
+    """Поколения областей ленты и время их последнего изменения.
+
+    Время - наибольшее из времён последнего сдвига областей
+    (time.time()); читается вместе с поколениями одним get_many.
+    """
+    cache = posts_cache()
+    keys = {scope_key(FEED_GENERATION_KEY, scope): scope for scope in scopes}
+    modified_keys = [
+        scope_key(FEED_MODIFIED_KEY, scope) for scope in scopes
+    ]
+    values = cache.get_many([*keys, *modified_keys])
+    for key in keys.keys() - values.keys():
+        cache.add(key, _new_generation(), None)
+        values[key] = cache.get(key)
+    now = time.time()
+    for key in set(modified_keys) - values.keys():
+        # Время неизвестно (ключ вытеснен): считаем, что только что
+        cache.add(key, now, None)
+        values[key] = now
+    return (
+        [values[key] for key in keys],
+        max((values[key] for key in modified_keys), default=None),
+    )
+
+
+def feed_generations(scopes):
+    """Текущие поколения областей ленты (одним обращением к кешу)."""
+    return feed_versions(scopes)[0]
+
+
+def bump_feeds(scopes):
+    """Сдвигает поколения областей: их закешированные страницы устаревают.
+
+    Сдвиг выполняется сразу, чтобы сама транзакция видела свои
+    записи, и ещё раз после коммита: иначе параллельный запрос успел
+    бы отрисовать ещё старые данные и сохранить их под новым
+    поколением до следующей записи.
+    """
+    scopes = set(scopes)
+    if scopes:
+        _now_and_on_commit(lambda: _bump_feeds(scopes))
+
+
+def _bump_feeds(scopes):
+    cache = posts_cache()
+    for scope in scopes:
+        key = scope_key(FEED_GENERATION_KEY, scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+    now = time.time()
+    cache.set_many(
+        {scope_key(FEED_MODIFIED_KEY, scope): now for scope in scopes},
+        None,
+    )
+
+
+def page_digest(request, *versions):
+    """Хеш адреса страницы, пользователя и версий её данных."""
+    raw_key = '|'.join(map(str, [
+        request.get_full_path(), request.user.pk, *versions,
+    ]))
+    return hashlib.md5(raw_key.encode()).hexdigest()
+
+
+def conditional_page(request, digest, modified, render):
+    """Условный GET: 304, если у клиента уже есть эта версия страницы.
+
+    ETag - `digest`, Last-Modified - `modified` (time.time()).
+    Last-Modified отдаётся, только когда с изменения прошла целая
+    секунда: HTTP-дата хранит секунды, и второе изменение в ту же
+    секунду не сдвинуло бы её. Страница разная для разных
+    пользователей и всегда перепроверяется: private, no-cache.
+    """
+    etag = quote_etag(digest)
+    last_modified = None
+    if modified is not None and time.time() - modified >= 1:
+        last_modified = int(modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cache_feed(get_scopes):
+    """Кеширует страницу ленты до смены поколения её областей.
+
+    `get_scopes(**kwargs)` по аргументам view возвращает области
+    ленты (index_scope, group_scope, author_scope), от которых
+    зависит страница. Ключ включает поколения областей, адрес
+    и пользователя, поэтому запись в ленту сразу даёт новый ключ,
+    а срок хранения может быть долгим. Пересчёт промаха выполняет
+    один запрос, остальные ждут его результат (single-flight).
+    Тот же ключ служит ETag: клиент, у которого страница уже есть,
+    получает 304 без чтения кеша страниц и без запросов к базе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            generations, modified = feed_versions(get_scopes(**kwargs))
+            digest = page_digest(request, *generations)
+            return conditional_page(
+                request, digest, modified, lambda: cached_response(
+                    FEED_PAGE_KEY.format(digest),
+                    lambda: view(request, *args, **kwargs),
+                )
+            )
+        return wrapper
+    return decorator
+
+
+def _response_from_cache(cached):
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def cached_response(key, render):
+    """Отдаёт ответ из кеша или рендерит его под блокировкой."""
+    cache = posts_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return _response_from_cache(cached)
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        # Страницу уже считает другой запрос: ждём его результат,
+        # а по истечении ожидания считаем сами
+        deadline = time.monotonic() + settings.FEED_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(FEED_LOCK_POLL)
+            cached = cache.get(key)
+            if cached is not None:
+                return _response_from_cache(cached)
+    try:
+        response = render()
+        if response.status_code == 200 and not response.streaming:
+            cache.set(
+                key,
+                (response.content, response['Content-Type']),
+                settings.FEED_CACHE_TIMEOUT,
+            )
+        return response
+    finally:
+        if locked:
+            cache.delete(lock_key)
@@ -0,0 +1,133 @@
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Comment, Follow, Post, TagPost
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+
+class Export:
+    """Выгрузка одной таблицы страницами по возрастанию id.
+
+    Страница выбирается условием id > последнего id прошлой
+    страницы (keyset), а не OFFSET, поэтому каждая страница стоит
+    одинаково, а в памяти одновременно лежит только одна страница
+    словарей из values(), без экземпляров моделей.
+    `columns` - имя поля в выгрузке и путь к нему в запросе.
+    """
+
+    def __init__(self, queryset, owner, columns):
+        self.queryset = queryset
+        self.owner = owner
+        self.columns = columns
+
+    @property
+    def header(self):
+        return list(self.columns)
+
+    def pages(self, user=None, chunk_size=None):
+        chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        queryset = self.queryset()
+        if user is not None:
+            queryset = queryset.filter(**{self.owner: user})
+        lookups = list(self.columns.values())
+        last_pk = 0
+        while True:
+            page = list(queryset.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list(*lookups)[:chunk_size])
+            if not page:
+                return
+            last_pk = page[-1][0]
+            yield self.rows(page)
+
+    def rows(self, page):
+        return [dict(zip(self.columns, values)) for values in page]
+
+    def records(self, user=None, chunk_size=None):
+        """Записи выгрузки по одной; `user` - только его данные."""
+        for page in self.pages(user, chunk_size):
+            yield from page
+
+
+class PostExport(Export):
+    """Посты вместе с тегами: теги страницы - одним запросом."""
+
+    def rows(self, page):
+        rows = super().rows(page)
+        tags = {}
+        for post_id, name in TagPost.objects.filter(
+            post_id__in=[row['id'] for row in rows]
+        ).order_by('tag__name').values_list('post_id', 'tag__name'):
+            tags.setdefault(post_id, []).append(name)
+        for row in rows:
+            row['tags'] = tags.get(row['id'], [])
+        return rows
+
+    @property
+    def header(self):
+        return [*self.columns, 'tags']
+
+
+# Поля выгрузки совпадают с полями импорта (posts/importing.py),
+# так что выгруженные посты можно загрузить обратно
+EXPORTS = {
+    'posts': PostExport(Post.objects.all, 'author', {
+        'id': 'pk',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'image': 'image',
+        'pub_date': 'pub_date',
+        'comment_count': 'comment_count',
+    }),
+    'comments': Export(Comment.objects.all, 'author', {
+        'id': 'pk',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'pub_date': 'pub_date',
+    }),
+    'follows': Export(
+        lambda: Follow.objects.filter(is_deleted=False), 'user', {
+            'id': 'pk',
+            'user': 'user__username',
+            'author': 'author__username',
+            'pub_date': 'pub_date',
+        }
+    ),
+}
+
+
+def export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def render_records(export, records, format='jsonl'):
+    """Строки файла выгрузки по одной записи."""
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(export.header)
+        for record in records:
+            yield writer.writerow([
+                ','.join(value) if isinstance(value, list)
+                else export_value(value)
+                for value in (record.get(name) for name in export.header)
+            ])
+        return
+    for record in records:
+        yield json.dumps(
+            {name: export_value(value) for name, value in record.items()},
+            ensure_ascii=False,
+        ) + '\n'
@@ -1,4 +1,8 @@
 from django import forms
+from django.conf import settings
+from PIL import Image
+
+from .images import normalize_image
 from .models import Post, Comment
 
 
@@ -17,6 +21,41 @@ class PostForm(forms.ModelForm):
             'image': 'Загрузите изображение',
         }
 
+    image_error_messages = {
+        'file_too_large': 'Файл слишком большой: больше %(limit)s МБ.',
+        'too_many_pixels': (
+            'Слишком большое изображение: %(width)s×%(height)s точек.'
+        ),
+        'invalid_format': 'Формат %(format)s не поддерживается.',
+    }
+
+    def clean_image(self):
+        """Проверяет размеры картинки и нормализует её до сохранения"""
+        data = self.cleaned_data['image']
+        # Прежняя картинка при правке уже проверена
+        if not data or data == self.initial.get('image'):
+            return data
+        if data.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            self.image_error('file_too_large', {
+                'limit': settings.IMAGE_MAX_UPLOAD_SIZE // 2 ** 20,
+            })
+        data.seek(0)
+        # Читается только заголовок: размеры известны до декодирования
+        image = Image.open(data)
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            self.image_error(
+                'too_many_pixels', {'width': width, 'height': height}
+            )
+        if image.format not in settings.IMAGE_UPLOAD_FORMATS:
+            self.image_error('invalid_format', {'format': image.format})
+        return normalize_image(data, image)
+
+    def image_error(self, code, params):
+        raise forms.ValidationError(
+            self.image_error_messages[code], code=code, params=params
+        )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,75 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps
+
+# Форматы без потерь сохраняются как есть, остальное - в JPEG
+LOSSLESS_FORMATS = {'PNG': '.png', 'GIF': '.gif'}
+
+
+def needs_normalization(image):
+    """Нужно ли перекодировать картинку перед сохранением."""
+    if getattr(image, 'is_animated', False):
+        # Анимацию не пересобираем, чтобы не потерять кадры
+        return False
+    progressive_jpeg = (
+        image.format == 'JPEG' and image.info.get('progressive')
+    )
+    return (
+        max(image.size) > settings.IMAGE_MAX_DIMENSION
+        or 'exif' in image.info
+        or (image.format not in LOSSLESS_FORMATS and not progressive_jpeg)
+    )
+
+
+def normalize_image(data, image):
+    """Уменьшает, очищает от EXIF и перекодирует загруженную картинку.
+
+    `image` - уже открытая (но не декодированная) картинка из `data`.
+    Возвращает новый файл для сохранения или `data`, если картинка
+    уже в порядке.
+    """
+    if not needs_normalization(image):
+        data.seek(0)
+        return data
+    source_format = image.format
+    # Цветовой профиль оставляем, иначе изменятся цвета
+    icc_profile = image.info.get('icc_profile')
+    # Поворот из EXIF применяем до того, как выбросим сами метаданные
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(
+        (settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION)
+    )
+    buffer = BytesIO()
+    if source_format in LOSSLESS_FORMATS:
+        image_format = source_format
+        extension = LOSSLESS_FORMATS[source_format]
+        image.save(
+            buffer,
+            format=image_format,
+            optimize=True,
+            icc_profile=icc_profile,
+        )
+    else:
+        image_format, extension = 'JPEG', '.jpg'
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(
+            buffer,
+            format=image_format,
+            quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+            icc_profile=icc_profile,
+        )
+    name = os.path.splitext(os.path.basename(data.name))[0] + extension
+    return InMemoryUploadedFile(
+        buffer,
+        field_name=getattr(data, 'field_name', None),
+        name=name,
+        content_type=Image.MIME[image_format],
+        size=buffer.tell(),
+        charset=None,
+    )
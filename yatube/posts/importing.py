@@ -0,0 +1,300 @@
+import csv
+import json
+import os
+import uuid
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.db import bulk_batch_size
+
+from .cache import author_scope, bump_feeds, group_scope, index_scope
+from .forms import PostForm
+from .models import AuthorStats, Group, Post, Tag, TimelineEntry, User
+from .search import index_posts
+from .thumbnails import schedule_thumbnails
+
+IMPORT_FORMATS = ('jsonl', 'csv')
+
+
+class RecordError(Exception):
+    """Запись нельзя импортировать; `errors` - ошибки по полям."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def guess_format(name):
+    """Формат файла по расширению: .csv или JSON Lines."""
+    return 'csv' if name.lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(lines, format='jsonl'):
+    """Пары (номер строки, запись) по одной, не читая файл целиком.
+
+    `lines` - итератор строк или байтов в UTF-8. Строка JSONL,
+    которая не является объектом, даёт запись None.
+    """
+    lines = (
+        line.decode('utf-8-sig') if isinstance(line, bytes) else line
+        for line in lines
+    )
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def tag_names(value):
+    """Теги записи: список или строка через запятую (из CSV).
+
+    Для значения другого типа бросает ValueError.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        return value.split(',')
+    if isinstance(value, list) and all(
+        isinstance(name, (str, int)) for name in value
+    ):
+        return [str(name) for name in value]
+    raise ValueError('Теги - список или строка через запятую')
+
+
+class PostImporter:
+    """Импорт постов пачками через bulk_create.
+
+    Каждая запись проверяется формой PostForm, то есть теми же
+    правилами, что и пост с сайта. Поля записи: text, group (адрес
+    группы), image (имя картинки для `open_image`), tags, pub_date
+    (ISO 8601) и author (имя пользователя; учитывается, только если
+    автор не задан для всего импорта). Каждая пачка сохраняется
+    в своей транзакции; bulk_create не вызывает save() и сигналы,
+    поэтому отрывки, поисковый индекс, ленты подписок, теги,
+    счётчики авторов и миниатюры импорт обновляет сам, пачкой.
+    """
+
+    def __init__(self, author=None, open_image=None, batch_size=None,
+                 limit=None):
+        self.author = author
+        self.open_image = open_image or (lambda name: None)
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.limit = limit
+        self.created = 0
+        self.errors = []
+
+    def run(self, records):
+        """Импортирует пары (номер строки, запись); возвращает self.
+
+        С ограничением `limit` записи сначала считываются (не больше
+        limit + 1): при превышении не импортируется ничего.
+        """
+        records = iter(records)
+        if self.limit is not None:
+            records = list(islice(records, self.limit + 1))
+            if len(records) > self.limit:
+                self.errors.append({
+                    'line': records[-1][0],
+                    'errors': {'__all__': [
+                        f'Больше {self.limit} записей за один импорт'
+                    ]},
+                })
+                return self
+            records = iter(records)
+        while True:
+            chunk = list(islice(records, self.batch_size))
+            if not chunk:
+                return self
+            self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        groups = self.lookup(Group, 'slug', chunk, 'group')
+        authors = {} if self.author else self.lookup(
+            User, 'username', chunk, 'author'
+        )
+        files = []
+        posts, tags = [], []
+        for number, record in chunk:
+            try:
+                post, post_tags = self.build(record, groups, authors, files)
+            except RecordError as error:
+                self.errors.append({'line': number, 'errors': error.errors})
+                continue
+            posts.append(post)
+            tags.append(post_tags)
+        try:
+            if posts:
+                self.save(posts, tags)
+        finally:
+            for file in files:
+                file.close()
+
+    def lookup(self, model, field, chunk, key):
+        """Объекты пачки по значениям поля `key` одним запросом."""
+        values = {
+            str(record[key]) for _, record in chunk
+            if record and record.get(key)
+        }
+        if not values:
+            return {}
+        return {
+            getattr(obj, field): obj
+            for obj in model.objects.filter(**{f'{field}__in': values})
+        }
+
+    def build(self, record, groups, authors, files):
+        """Пост и имена тегов из записи, проверенной формой PostForm."""
+        if record is None:
+            raise RecordError({'__all__': ['Ожидался объект с полями поста']})
+        errors = {}
+        author = self.author or authors.get(str(record.get('author') or ''))
+        if author is None:
+            errors['author'] = ['Автор не найден']
+        group = None
+        if record.get('group'):
+            group = groups.get(str(record['group']))
+            if group is None:
+                errors['group'] = ['Группа не найдена']
+        pub_date = self.pub_date(record.get('pub_date'), errors)
+        try:
+            tags = tag_names(record.get('tags'))
+        except ValueError as error:
+            errors['tags'] = [str(error)]
+        image_files = self.image(record.get('image'), errors, files)
+        form = PostForm(
+            data={'text': record.get('text') or ''}, files=image_files
+        )
+        if not form.is_valid():
+            errors.update(
+                (field, list(messages))
+                for field, messages in form.errors.items()
+            )
+        if errors:
+            raise RecordError(errors)
+        post = form.save(commit=False)
+        post.author = author
+        post.group = group
+        post.excerpt = Post.make_excerpt(post.text)
+        post.pub_date = pub_date
+        return post, tags
+
+    def image(self, name, errors, files):
+        """Файлы формы с картинкой записи; открытый файл - в `files`."""
+        if not name:
+            return None
+        image = self.open_image(str(name))
+        if image is None:
+            errors['image'] = ['Картинка не найдена']
+            return None
+        files.append(image)
+        return {'image': image}
+
+    def pub_date(self, value, errors):
+        if not value:
+            return None
+        try:
+            # Верный формат с несуществующей датой даёт ValueError
+            date = parse_datetime(str(value))
+        except ValueError:
+            date = None
+        if date is None:
+            errors['pub_date'] = ['Дата не в формате ISO 8601']
+            return None
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def save(self, posts, tags):
+        """Сохраняет пачку постов и всё, что обычно ведут сигналы."""
+        dates = [post.pub_date for post in posts]
+        with transaction.atomic():
+            marked = insert_posts(posts, bulk_batch_size(
+                Post, posts, self.batch_size
+            ))
+            # pub_date заполняется при вставке (auto_now_add),
+            # даты из архива проставляются отдельным UPDATE
+            dated = []
+            for post, date in zip(posts, dates):
+                if date is not None:
+                    post.pub_date = date
+                    dated.append(post)
+            if marked:
+                Post.objects.bulk_update(posts, ('excerpt', 'pub_date'))
+            else:
+                Post.objects.bulk_update(dated, ('pub_date',))
+            Tag.objects.attach_many(zip(posts, tags))
+            index_posts(posts)
+            TimelineEntry.objects.fan_out(posts)
+            for author_id, count in Counter(
+                post.author_id for post in posts
+            ).items():
+                AuthorStats.objects.change(author_id, posts=count)
+        self.created += len(posts)
+        for name in {post.image.name for post in posts if post.image}:
+            schedule_thumbnails(name)
+        bump_feeds([
+            index_scope(),
+            *{author_scope(post.author.username) for post in posts},
+            *{group_scope(post.group.slug) for post in posts if post.group},
+        ])
+
+
+def insert_posts(posts, batch_size):
+    """bulk_create, после которого у постов проставлены id.
+
+    Id из bulk_create возвращает только PostgreSQL. В остальных
+    базах отрывок поста на время вставки заменяется меткой пачки
+    с номером поста, и id читаются по меткам одним запросом.
+    Возвращает True, если отрывки нужно записать заново.
+    """
+    connection = connections[router.db_for_write(Post)]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Post.objects.bulk_create(posts, batch_size=batch_size)
+        return False
+    # Новые строки получат id больше текущего наибольшего:
+    # по нему метки ищутся через индекс первичного ключа
+    last_pk = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    marker = f'import:{uuid.uuid4().hex}:'
+    excerpts = [post.excerpt for post in posts]
+    for number, post in enumerate(posts):
+        post.excerpt = f'{marker}{number}'
+    Post.objects.bulk_create(posts, batch_size=batch_size)
+    for excerpt, pk in Post.objects.filter(
+        pk__gt=last_pk, excerpt__startswith=marker
+    ).values_list('excerpt', 'pk'):
+        posts[int(excerpt[len(marker):])].pk = pk
+    for post, excerpt in zip(posts, excerpts):
+        post.excerpt = excerpt
+    return True
+
+
+def open_image_in(directory):
+    """Открывает картинки записей из каталога `directory`."""
+    root = os.path.realpath(directory)
+
+    def open_image(name):
+        path = os.path.realpath(os.path.join(root, name))
+        # Имя из файла импорта не должно выводить за пределы каталога
+        if os.path.commonpath([root, path]) != root:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return File(open(path, 'rb'), name=os.path.basename(path))
+    return open_image
@@ -0,0 +1,120 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.middleware import query_budget
+from posts.benchmark import BENCHMARK_VIEWS, measure, regressions
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет перцентили времени ответа и число запросов лент; '
+        'при необходимости сначала наполняет базу синтетическими данными'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views', nargs='*',
+            help='Какие ленты замерять: ' + ', '.join(BENCHMARK_VIEWS)
+                 + ' (по умолчанию все)',
+        )
+        parser.add_argument(
+            '--seed-data', action='store_true',
+            help='Перед замером создать пользователей, группы, посты '
+                 'и подписки (см. --users, --groups, --posts, --follows, '
+                 '--comments)',
+        )
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--comments', type=float, default=3,
+            help='Среднее число комментариев к посту',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: одинаковое зерно - одинаковые данные',
+        )
+        parser.add_argument(
+            '--samples', type=int, default=20,
+            help='Сколько разных страниц каждой ленты открыть',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=1,
+            help='Сколько раз открыть каждую страницу',
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кеш перед запросами',
+        )
+        parser.add_argument(
+            '--save', metavar='FILE',
+            help='Сохранить результаты в JSON как базовые',
+        )
+        parser.add_argument(
+            '--baseline', metavar='FILE',
+            help='Сравнить с базовыми результатами и завершиться '
+                 'с ошибкой при регрессии',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно базового (доля)',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['views']) - set(BENCHMARK_VIEWS)
+        if unknown:
+            raise CommandError('Неизвестные ленты: ' + ', '.join(unknown))
+        if options['seed_data']:
+            Seeder(
+                seed=options['seed'], log=self.stdout.write
+            ).run(
+                options['users'], options['groups'],
+                options['posts'], options['follows'],
+                comments=options['comments'],
+            )
+        results = {}
+        over_budget = []
+        for view in options['views'] or BENCHMARK_VIEWS:
+            result = measure(
+                view,
+                samples=options['samples'],
+                repeat=options['repeat'],
+                warm=options['warm'],
+                seed=options['seed'],
+            )
+            results[view] = result
+            if result is None:
+                self.stdout.write(f'{view}: нет данных для замера')
+                continue
+            budget = query_budget(BENCHMARK_VIEWS[view])
+            if budget is not None and result['queries'] > budget:
+                over_budget.append(view)
+            self.stdout.write(
+                f'{view}: p50 {result["p50"]} мс, p95 {result["p95"]} мс, '
+                f'p99 {result["p99"]} мс, запросов {result["queries"]} '
+                f'(бюджет {budget}), замеров {result["requests"]}'
+            )
+        self.stdout.write(f'СУБД: {connection.vendor}')
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        self.check_results(results, over_budget, options)
+
+    def check_results(self, results, over_budget, options):
+        problems = [
+            f'{view}: превышен бюджет запросов' for view in over_budget
+        ]
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            problems += regressions(results, baseline, options['tolerance'])
+        if problems:
+            raise CommandError('Регрессии:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
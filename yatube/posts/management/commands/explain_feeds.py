@@ -0,0 +1,86 @@
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.models import Follow, Group, Post, TimelineEntry, User
+from posts.utils import CursorPaginator
+from posts.views import comments_paginator
+
+# Признаки сортировки без индекса в планах разных СУБД
+FILESORT_MARKERS = re.compile(
+    r'TEMP B-TREE|Using filesort|\bSort\b', re.IGNORECASE
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы и время запросов лент из posts/views.py '
+        'и проверяет, что сортировка идёт по индексу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Завершиться с ошибкой, если в плане есть сортировка',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз выполнить каждый запрос для замера',
+        )
+
+    def feed_queries(self):
+        """Запросы первых страниц лент, собранные как во view.
+
+        Сортировку задают те же queryset и паджинаторы, что и во view,
+        поэтому план показывает настоящий порядок выборки.
+        """
+        per_page = settings.QUANTITY_PAGINATE
+        # В пустой базе - несуществующий пост: запрос тот же
+        post = Post.objects.order_by().first() or Post(pk=0)
+        author = User.objects.filter(posts__isnull=False).first() or User()
+        group = Group.objects.first() or Group()
+        reader = (
+            User.objects.filter(timeline__isnull=False).first() or User()
+        )
+        return {
+            'index': Post.objects.feed()[:per_page],
+            'group_posts': Post.objects.feed().filter(
+                group=group
+            )[:per_page],
+            'profile': Post.objects.feed().filter(author=author)[:per_page],
+            # exists() во view выполняется без сортировки
+            'profile (follow check)': Follow.objects.filter(
+                user=reader, author=author, is_deleted=False
+            ).order_by()[:1],
+            'post_detail (comments)': comments_paginator(
+                post
+            ).page_queryset(),
+            'follow_index': CursorPaginator(
+                TimelineEntry.objects.feed(reader), per_page
+            ).page_queryset(),
+        }
+
+    def handle(self, *args, **options):
+        slow_plans = []
+        for name, queryset in self.feed_queries().items():
+            plan = queryset.explain()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset)
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            sorted_by_index = not FILESORT_MARKERS.search(plan)
+            if not sorted_by_index:
+                slow_plans.append(name)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {elapsed * 1000:.2f} мс, '
+                f'{"индекс" if sorted_by_index else "СОРТИРОВКА"}'
+            ))
+            self.stdout.write(plan)
+        self.stdout.write(f'СУБД: {connection.vendor}')
+        if options['check'] and slow_plans:
+            raise CommandError(
+                'Сортировка без индекса: ' + ', '.join(slow_plans)
+            )
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exporting import EXPORT_FORMATS, EXPORTS, render_records
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии или подписки в JSON Lines или CSV '
+        'потоком, не загружая таблицу в память'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS, default='jsonl',
+        )
+        parser.add_argument(
+            '--user', help='Выгрузить только данные этого пользователя',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки (по умолчанию стандартный вывод)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Сколько записей читать одним запросом',
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(
+                    f'Пользователь {options["user"]} не найден'
+                )
+        export = EXPORTS[options['kind']]
+        lines = render_records(
+            export,
+            export.records(user, options['chunk_size']),
+            options['format'],
+        )
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        try:
+            output = open(
+                options['output'], 'w', encoding='utf-8', newline=''
+            )
+        except OSError as error:
+            raise CommandError(error)
+        with output:
+            output.writelines(lines)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import schedule_thumbnails, wait_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для уже загруженных картинок постов'
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by().values_list('image', flat=True).distinct()
+        total = 0
+        for name in names.iterator():
+            schedule_thumbnails(name)
+            total += 1
+        wait_thumbnails()
+        self.stdout.write(self.style.SUCCESS(
+            f'Подготовлены миниатюры картинок: {total}'
+        ))
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importing import (
+    IMPORT_FORMATS, PostImporter, guess_format, open_image_in, read_records
+)
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты из файла JSON Lines или CSV пачками, '
+        'с проверкой по правилам формы поста'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл с постами; "-" - стандартный ввод',
+        )
+        parser.add_argument(
+            '--format', choices=IMPORT_FORMATS,
+            help='Формат файла (по умолчанию по расширению)',
+        )
+        parser.add_argument(
+            '--author',
+            help='Автор всех постов; без него автор берётся '
+                 'из поля author каждой записи',
+        )
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог с картинками из поля image '
+                 '(по умолчанию каталог файла)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Сколько постов сохранять в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        author = None
+        if options['author']:
+            author = User.objects.filter(username=options['author']).first()
+            if author is None:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден'
+                )
+        images_dir = options['images_dir'] or (
+            os.getcwd() if path == '-' else os.path.dirname(
+                os.path.abspath(path)
+            )
+        )
+        importer = PostImporter(
+            author=author,
+            open_image=open_image_in(images_dir),
+            batch_size=options['batch_size'],
+        )
+        file_format = options['format'] or guess_format(path)
+        started = time.perf_counter()
+        if path == '-':
+            importer.run(read_records(sys.stdin, file_format))
+        else:
+            try:
+                lines = open(path, encoding='utf-8-sig', newline='')
+            except OSError as error:
+                raise CommandError(error)
+            with lines:
+                importer.run(read_records(lines, file_format))
+        elapsed = time.perf_counter() - started
+        for error in importer.errors:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {importer.created} за {elapsed:.1f} с, '
+            f'с ошибками пропущено записей: {len(importer.errors)}'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import index_posts
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов индексировать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        last_pk = 0
+        while True:
+            posts = list(Post.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).only('pk', 'text')[:options['batch_size']])
+            if not posts:
+                break
+            index_posts(posts)
+            total += len(posts)
+            last_pk = posts[-1].pk
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total}'
+        ))
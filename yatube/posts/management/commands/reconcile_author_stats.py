@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики постов и подписчиков авторов с данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько авторов сверять за один проход',
+        )
+
+    def handle(self, *args, **options):
+        created, fixed = AuthorStats.objects.reconcile(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано счётчиков: {created}, исправлено: {fixed}'
+        ))
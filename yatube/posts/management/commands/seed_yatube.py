@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками для нагрузочных тестов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--comments', type=float, default=3,
+            help='Среднее число комментариев к посту',
+        )
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0,
+            help='Доля постов с картинкой, от 0 до 1',
+        )
+        parser.add_argument(
+            '--image-pool', type=int, default=20,
+            help='Сколько разных картинок делят между собой посты',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить посты',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: одинаковое зерно - одинаковые данные',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько записей создавать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images - доля от 0 до 1')
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        seeder = Seeder(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            days=options['days'],
+            image_pool=options['image_pool'],
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        seeder.run(
+            options['users'], options['groups'], options['posts'],
+            options['follows'], comments=options['comments'],
+            images=options['images'],
+        )
+        elapsed = time.perf_counter() - started
+        rows = sum(phase.count for phase in seeder.phases)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с: {rows} записей, '
+            f'{rows / elapsed:.0f} в секунду'
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    """Оставляет по одной (самой ранней) активной подписке на автора."""
+    Follow = apps.get_model('posts', 'Follow')
+    duplicates = Follow.objects.filter(is_deleted=False).values(
+        'user', 'author'
+    ).annotate(
+        first_pk=models.Min('pk'), total=models.Count('pk')
+    ).filter(total__gt=1).order_by()
+    for row in duplicates:
+        Follow.objects.filter(
+            user=row['user'], author=row['author'], is_deleted=False
+        ).exclude(pk=row['first_pk']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_follows, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'pub_date'], name='comment_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', 'author'], name='follow_user_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'pub_date'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'pub_date'], name='post_group_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'pub_date'], name='timeline_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(condition=models.Q(is_deleted=False), fields=('user', 'author'), name='unique_active_follow'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:11
+
+from collections import Counter
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия posts.search.tokenize на момент миграции: миграция
+# не должна зависеть от кода приложения, который будет меняться
+WORD_RE = re.compile(r'\w{2,}')
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    words = (
+        word[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+    )
+    return Counter(words)
+
+
+def build_search_index(apps, schema_editor):
+    """Индексирует уже опубликованные посты."""
+    Post = apps.get_model('posts', 'Post')
+    PostSearchToken = apps.get_model('posts', 'PostSearchToken')
+    tokens = []
+    for post_id, text in Post.objects.values_list('pk', 'text').iterator():
+        tokens.extend(
+            PostSearchToken(term=term, post_id=post_id, weight=min(
+                weight, 32767
+            ))
+            for term, weight in tokenize(text).items()
+        )
+        if len(tokens) >= 1000:
+            PostSearchToken.objects.bulk_create(tokens)
+            tokens = []
+    PostSearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Слово')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='Вес')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:26
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+EXCERPT_LENGTH = 350
+BATCH_SIZE = 1000
+
+
+def fill_excerpt(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).only('pk', 'text')[:BATCH_SIZE])
+        if not posts:
+            break
+        for post in posts:
+            post.excerpt = Truncator(post.text).chars(EXCERPT_LENGTH)
+        Post.objects.bulk_update(posts, ['excerpt'])
+        last_pk = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_postimagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=350, verbose_name='Отрывок'),
+        ),
+        migrations.RunPython(fill_excerpt, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils.text import Truncator
 from django.contrib.auth import get_user_model
 from .validators import validate_not_empty
 from django.conf import settings
+from core.db import bulk_batch_size
 from core.models import CreatedModel
+from .cache import bump_feeds, tag_scope
 
 
 User = get_user_model()
@@ -22,6 +26,143 @@ class Group(models.Model):
         verbose_name_plural = 'Сообщества'
 
 
+class TagManager(models.Manager):
+    """Менеджер тегов: привязка тегов к постам пачкой."""
+
+    def normalize(self, names):
+        """Имена тегов без решётки и повторов, в нижнем регистре."""
+        max_length = self.model._meta.get_field('name').max_length
+        normalized = {}
+        for name in names:
+            name = name.strip().lstrip('#').strip().lower()[:max_length]
+            if name:
+                normalized.setdefault(name)
+        return list(normalized)
+
+    def resolve(self, names):
+        """Теги по именам, недостающие создаются.
+
+        Не больше трёх запросов на любое число тегов: выборка
+        существующих, bulk_create недостающих и выборка созданных
+        (bulk_create в sqlite не возвращает id).
+        """
+        names = self.normalize(names)
+        if not names:
+            return []
+        tags = {tag.name: tag for tag in self.filter(name__in=names)}
+        missing = [name for name in names if name not in tags]
+        if missing:
+            self.bulk_create(
+                [self.model(name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            tags.update(
+                (tag.name, tag) for tag in self.filter(name__in=missing)
+            )
+        return [tags[name] for name in names]
+
+    def attach_many(self, post_tags):
+        """Привязывает теги к постам: пары (пост, имена тегов).
+
+        Теги всех постов разрешаются вместе, связи создаются
+        одним bulk_create, поэтому число запросов не зависит
+        ни от числа тегов, ни от числа постов.
+        """
+        post_tags = [
+            (post, self.normalize(names)) for post, names in post_tags
+        ]
+        tags = {tag.name: tag for tag in self.resolve(
+            name for _, names in post_tags for name in names
+        )}
+        links = [
+            TagPost(tag=tags[name], post=post)
+            for post, names in post_tags
+            for name in names
+        ]
+        TagPost.objects.bulk_create(links, batch_size=bulk_batch_size(
+            TagPost, links, settings.TAG_BATCH_SIZE
+        ), ignore_conflicts=True)
+        # bulk_create не вызывает сигналы: ленты тегов сбрасываем сами
+        bump_feeds([tag_scope(name) for name in tags])
+        return list(tags.values())
+
+    def attach(self, post, names):
+        return self.attach_many([(post, names)])
+
+    def set_for(self, post, names):
+        """Заменяет теги поста на `names`."""
+        names = self.normalize(names)
+        removed = list(TagPost.objects.filter(post=post).exclude(
+            tag__name__in=names
+        ).values_list('tag__name', flat=True))
+        if removed:
+            TagPost.objects.filter(
+                post=post, tag__name__in=removed
+            ).delete()
+            bump_feeds([tag_scope(name) for name in removed])
+        return self.attach(post, names)
+
+
+class Tag(models.Model):
+    """Класс для описания тегов постов"""
+    name = models.CharField('Имя', max_length=50, unique=True)
+
+    objects = TagManager()
+
+    class Meta:
+        ordering = ('name',)
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+
+    def __str__(self):
+        return self.name
+
+
+# Поля, которые выводит карточка поста в ленте
+# (posts/includes/post_list.html): остальные не загружаются
+FEED_POST_FIELDS = (
+    'excerpt', 'pub_date', 'image', 'updated', 'comment_count',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug',
+)
+
+
+def with_feed_lookups(queryset, prefix='', comments=None, fields=()):
+    """Добавляет к запросу всё, что нужно карточкам постов ленты.
+
+    Автор и группа берутся JOIN-ом, варианты картинки и (если
+    `comments` > 0) последние комментарии - по одному запросу
+    на страницу. `prefix` - путь от модели запроса до поста,
+    например 'post__' для записей ленты подписок, `fields` - нужные
+    ещё поля самой модели запроса.
+    """
+    if comments is None:
+        comments = settings.FEED_LATEST_COMMENTS
+    lookups = [f'{prefix}image_variants']
+    if comments:
+        latest = Comment.objects.filter(
+            post=models.OuterRef('post')
+        ).order_by('-pub_date', '-pk').values('pk')[:comments]
+        lookups.append(models.Prefetch(
+            f'{prefix}comments',
+            queryset=Comment.objects.filter(
+                pk__in=models.Subquery(latest)
+            ).select_related('author'),
+            to_attr='latest_comments',
+        ))
+    return queryset.select_related(
+        f'{prefix}author', f'{prefix}group'
+    ).prefetch_related(*lookups).only(
+        *fields, *(f'{prefix}{field}' for field in FEED_POST_FIELDS)
+    )
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self, comments=None):
+        """Посты для ленты без ленивых запросов на каждую карточку."""
+        return with_feed_lookups(self, comments=comments)
+
+
 class Post(CreatedModel):
     """Класс для описания записей/постов"""
     text = models.TextField(
@@ -52,12 +193,63 @@ class Post(CreatedModel):
     )
     # Аргумент upload_to указывает директорию,
     # в которую будут загружаться пользовательские файлы.
+    # Время последнего изменения поста или его комментариев:
+    # входит в ключ кеша карточки поста (posts/cache.py)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    # Начало текста для ленты, пересчитывается при сохранении:
+    # лента не загружает текст поста целиком
+    excerpt = models.CharField(
+        'Отрывок',
+        max_length=settings.POST_EXCERPT_LENGTH,
+        blank=True,
+        editable=False
+    )
+    # Денормализованный счётчик комментариев для ленты,
+    # поддерживается сигналами из posts/signals.py
+    comment_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+    tags = models.ManyToManyField(
+        Tag,
+        through='TagPost',
+        related_name='posts',
+        blank=True,
+        verbose_name='Теги'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:settings.QUANTITY_SYMBOL]
 
+    @staticmethod
+    def make_excerpt(text):
+        """Отрывок текста для ленты (как фильтр truncatechars)"""
+        return Truncator(text).chars(settings.POST_EXCERPT_LENGTH)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.excerpt = self.make_excerpt(self.text)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
+        # Индексы под ленты автора и группы: фильтр + сортировка по дате.
+        # Возрастающий порядок: обратный проход по индексу даёт
+        # ORDER BY pub_date DESC, id DESC без дополнительной сортировки
+        indexes = [
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_date_idx'
+            ),
+        ]
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
 
@@ -82,6 +274,11 @@ class Comment(CreatedModel):
 
     class Meta:
         ordering = ['pub_date']
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'], name='comment_post_date_idx'
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -89,6 +286,31 @@ class Comment(CreatedModel):
         return 'Comment {} by {}'.format(self.text, self.author)
 
 
+class TagPost(models.Model):
+    """Связь поста с тегом"""
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_links',
+        verbose_name='Тег'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tag_links',
+        verbose_name='Пост'
+    )
+
+    class Meta:
+        # Уникальный индекс (tag, post) служит и для ленты тега
+        unique_together = ('tag', 'post')
+        verbose_name = 'Тег поста'
+        verbose_name_plural = 'Теги постов'
+
+    def __str__(self):
+        return f'{self.tag_id} -> {self.post_id}'
+
+
 class Follow(CreatedModel):
     """Класс для описания системы подписки на авторов"""
     user = models.ForeignKey(
@@ -115,6 +337,20 @@ class Follow(CreatedModel):
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx'
+            ),
+        ]
+        # Активная подписка на автора может быть только одна,
+        # отписки (is_deleted=True) в ограничении не участвуют
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                condition=models.Q(is_deleted=False),
+                name='unique_active_follow',
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
@@ -123,3 +359,318 @@ class Follow(CreatedModel):
             return f'{self.user} подписался на {self.author}'
         else:
             return f'{self.user} отписался от {self.author}'
+
+
+class AuthorStatsManager(models.Manager):
+    """Менеджер счётчиков автора."""
+
+    def fresh(self, author_ids):
+        """Пересчитывает счётчики авторов по исходным таблицам."""
+        posts = Post.objects.filter(
+            author=models.OuterRef('pk')
+        ).order_by().values('author').annotate(
+            total=models.Count('pk')
+        ).values('total')
+        followers = Follow.objects.filter(
+            author=models.OuterRef('pk'), is_deleted=False
+        ).order_by().values('author').annotate(
+            total=models.Count('pk')
+        ).values('total')
+        authors = User.objects.filter(pk__in=author_ids).annotate(
+            fresh_posts=Coalesce(models.Subquery(
+                posts, output_field=models.IntegerField()
+            ), 0),
+            fresh_followers=Coalesce(models.Subquery(
+                followers, output_field=models.IntegerField()
+            ), 0),
+        ).values_list('pk', 'fresh_posts', 'fresh_followers')
+        return [
+            self.model(
+                author_id=pk,
+                posts_count=posts_count,
+                followers_count=followers_count,
+            )
+            for pk, posts_count, followers_count in authors
+        ]
+
+    def recount(self, author_id):
+        """Пересчитывает и сохраняет счётчики одного автора."""
+        fresh = self.fresh([author_id])
+        if not fresh:
+            # Автор уже удалён вместе со своей статистикой
+            return None
+        stats = fresh[0]
+        try:
+            with transaction.atomic():
+                stats, _ = self.update_or_create(
+                    author_id=author_id,
+                    defaults={
+                        'posts_count': stats.posts_count,
+                        'followers_count': stats.followers_count,
+                    },
+                )
+        except IntegrityError:
+            stats = self.get(author_id=author_id)
+        return stats
+
+    def for_author(self, author):
+        """Возвращает счётчики автора, создавая их при первом обращении."""
+        return self.filter(author=author).first() or self.recount(author.pk)
+
+    def change(self, author_id, posts=0, followers=0):
+        """Атомарно сдвигает счётчики автора на заданные величины."""
+        guards = {}
+        if posts < 0:
+            guards['posts_count__gte'] = -posts
+        if followers < 0:
+            guards['followers_count__gte'] = -followers
+        updated = self.filter(author_id=author_id, **guards).update(
+            posts_count=models.F('posts_count') + posts,
+            followers_count=models.F('followers_count') + followers,
+        )
+        if not updated:
+            # Строки ещё нет или счётчик разошёлся с данными:
+            # пересчёт уже учитывает текущее изменение
+            self.recount(author_id)
+
+    def reconcile(self, batch_size=1000):
+        """Исправляет расхождения счётчиков со всеми авторами.
+
+        Возвращает пару (создано, исправлено).
+        """
+        created = fixed = 0
+        last_pk = 0
+        while True:
+            author_ids = list(User.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not author_ids:
+                return created, fixed
+            last_pk = author_ids[-1]
+            current = self.in_bulk(author_ids)
+            missing, drifted = [], []
+            for stats in self.fresh(author_ids):
+                old = current.get(stats.author_id)
+                if old is None:
+                    missing.append(stats)
+                elif (
+                    old.posts_count != stats.posts_count
+                    or old.followers_count != stats.followers_count
+                ):
+                    drifted.append(stats)
+            with transaction.atomic():
+                self.bulk_create(missing, ignore_conflicts=True)
+                self.bulk_update(
+                    drifted, ('posts_count', 'followers_count')
+                )
+            created += len(missing)
+            fixed += len(drifted)
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора: посты и подписчики"""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0
+    )
+
+    objects = AuthorStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return (
+            f'{self.author_id}: постов {self.posts_count}, '
+            f'подписчиков {self.followers_count}'
+        )
+
+
+class TimelineEntryManager(models.Manager):
+    """Менеджер материализованной ленты подписок."""
+
+    def feed(self, user):
+        """Лента пользователя: один диапазон по индексу (user, pub_date)."""
+        return with_feed_lookups(
+            self.filter(user=user), prefix='post__', fields=('pub_date',)
+        )
+
+    def _bulk_add(self, entries):
+        self.bulk_create(
+            entries,
+            batch_size=bulk_batch_size(
+                self.model, entries, settings.TIMELINE_BATCH_SIZE
+            ),
+            ignore_conflicts=True,
+        )
+
+    def fan_out(self, posts):
+        """Раскладывает новые посты по лентам подписчиков авторов.
+
+        Авторы, у которых подписчиков больше
+        settings.TIMELINE_FANOUT_LIMIT, пропускаются: их посты
+        подтягиваются в ленты при чтении (pull_celebrities).
+        """
+        by_author = {}
+        for post in posts:
+            by_author.setdefault(post.author_id, []).append(post)
+        celebrities = set(AuthorStats.objects.filter(
+            author_id__in=by_author,
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True))
+        follows = Follow.objects.filter(
+            author_id__in=set(by_author) - celebrities, is_deleted=False
+        ).values_list('user_id', 'author_id')
+        entries = []
+        for user_id, author_id in follows.iterator():
+            entries.extend(
+                self.model(
+                    user_id=user_id,
+                    post_id=post.pk,
+                    author_id=author_id,
+                    pub_date=post.pub_date,
+                )
+                for post in by_author[author_id]
+            )
+            if len(entries) >= settings.TIMELINE_BATCH_SIZE:
+                self._bulk_add(entries)
+                entries = []
+        self._bulk_add(entries)
+
+    def backfill(self, user_id, author_ids, since=None):
+        """Добавляет в ленту последние посты авторов."""
+        posts = Post.objects.filter(author_id__in=author_ids)
+        if since is not None:
+            posts = posts.filter(pub_date__gte=since)
+        posts = posts.order_by('-pub_date').values_list(
+            'pk', 'author_id', 'pub_date'
+        )[:settings.TIMELINE_BACKFILL]
+        self._bulk_add([
+            self.model(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, author_id, pub_date in posts
+        ])
+
+    def remove(self, user_id, author_id):
+        """Убирает из ленты посты автора после отписки."""
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def pull_celebrities(self, user):
+        """Догружает в ленту свежие посты популярных авторов."""
+        celebrities = list(Follow.objects.filter(
+            user=user,
+            is_deleted=False,
+            author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True))
+        if not celebrities:
+            return
+        since = self.filter(
+            user=user, author_id__in=celebrities
+        ).aggregate(since=models.Max('pub_date'))['since']
+        self.backfill(user.pk, celebrities, since=since)
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    # Денормализованные поля поста: автор нужен для отписки,
+    # дата - для сортировки ленты без соединения с постами
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        ordering = ('-pub_date', '-pk')
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date'], name='timeline_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user_id}: пост {self.post_id}'
+
+
+class PostSearchToken(models.Model):
+    """Запись инвертированного индекса поиска: слово -> пост"""
+    term = models.CharField('Слово', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='Пост'
+    )
+    # Сколько раз слово встречается в тексте поста
+    weight = models.PositiveSmallIntegerField('Вес', default=1)
+
+    class Meta:
+        unique_together = ('term', 'post')
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+
+    def __str__(self):
+        return f'{self.term} -> {self.post_id}'
+
+
+class PostImageVariant(models.Model):
+    """Уменьшенная копия картинки поста определённой ширины и формата"""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Пост'
+    )
+    image = models.ImageField('Файл', max_length=255)
+    format = models.CharField('Формат', max_length=10)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    size = models.PositiveIntegerField('Размер, байт', default=0)
+
+    class Meta:
+        ordering = ('post', 'format', 'width')
+        unique_together = ('post', 'format', 'width')
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+
+    def __str__(self):
+        return f'{self.post_id}: {self.format} {self.width}w'
@@ -0,0 +1,57 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from core.db import bulk_batch_size
+
+from .models import PostSearchToken
+
+WORD_RE = re.compile(r'\w{2,}')
+MAX_TERM_LENGTH = PostSearchToken._meta.get_field('term').max_length
+MAX_WEIGHT = 32767
+
+
+def tokenize(text):
+    """Разбивает текст на слова для индекса: слово -> число вхождений."""
+    words = (
+        word[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+    )
+    return Counter(words)
+
+
+def index_posts(posts):
+    """Перестраивает поисковый индекс для переданных постов."""
+    posts = list(posts)
+    PostSearchToken.objects.filter(post__in=posts).delete()
+    tokens = [
+        PostSearchToken(
+            term=term, post_id=post.pk, weight=min(weight, MAX_WEIGHT)
+        )
+        for post in posts
+        for term, weight in tokenize(post.text).items()
+    ]
+    PostSearchToken.objects.bulk_create(tokens, batch_size=bulk_batch_size(
+        PostSearchToken, tokens, settings.SEARCH_BATCH_SIZE
+    ))
+
+
+def search_posts(query):
+    """Id постов, содержащих все слова запроса, по убыванию релевантности.
+
+    Релевантность - суммарное число вхождений слов запроса,
+    при равенстве выше более новые посты.
+    """
+    terms = list(tokenize(query))
+    if not terms:
+        return []
+    matches = PostSearchToken.objects.filter(term__in=terms).values(
+        'post_id'
+    ).annotate(
+        matched=Count('pk'), score=Sum('weight')
+    ).filter(matched=len(terms)).order_by('-score', '-post_id')
+    return list(
+        matches.values_list('post_id', flat=True)[:settings.SEARCH_MAX_RESULTS]
+    )
@@ -0,0 +1,355 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from core.db import bulk_batch_size
+
+from .cache import author_scope, bump_feeds, group_scope, index_scope
+from .models import (
+    AuthorStats, Comment, Follow, Group, Post, PostImageVariant,
+    TimelineEntry, User
+)
+from .search import index_posts
+from .thumbnails import render_thumbnails
+
+# Показатель степенного распределения популярности авторов и групп:
+# несколько авторов пишут и собирают подписчиков больше всех остальных
+ZIPF_EXPONENT = 1.1
+# Доля постов, опубликованных в какой-нибудь группе
+GROUP_SHARE = 0.7
+# Размер синтетических картинок постов
+SEED_IMAGE_SIZE = (1200, 800)
+
+
+@contextmanager
+def explicit_pub_dates(*models):
+    """Позволяет задать pub_date вручную (auto_now_add отключается)."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def zipf_weights(count, exponent=ZIPF_EXPONENT):
+    """Накопленные веса степенного закона для random.choices."""
+    return list(accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)
+    ))
+
+
+class Phase:
+    """Замер скорости одного этапа наполнения базы."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, count):
+        self.count += count
+        self.seconds = time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.count / self.seconds if self.seconds else 0
+
+    def __str__(self):
+        return (
+            f'{self.name}: {self.count} за {self.seconds:.1f} с '
+            f'({self.rate:.0f} в секунду)'
+        )
+
+
+def _max_pk(model):
+    return model.objects.aggregate(pk=Max('pk'))['pk'] or 0
+
+
+class Seeder:
+    """Быстро наполняет базу синтетическими данными через bulk_create.
+
+    Записи создаются пачками по `batch_size`, каждая пачка - в своей
+    транзакции. Данные детерминированы: один и тот же `seed` даёт те же
+    тексты, связи и даты. bulk_create не вызывает save() и сигналы,
+    поэтому производные данные (отрывки, счётчики комментариев,
+    поисковый индекс, ленты подписок, счётчики авторов, миниатюры,
+    поколения кеша лент) Seeder строит сам.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, days=365, image_pool=20,
+                 log=None):
+        self.random = random.Random(seed)
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(seed)
+        self.seed = seed
+        self.batch_size = batch_size
+        self.days = days
+        self.image_pool = image_pool
+        self.log = log or (lambda message: None)
+        self.user_ids = []
+        self.group_ids = []
+        self.images = []
+        self.phases = []
+        self.first_post_pk = _max_pk(Post) + 1
+
+    @contextmanager
+    def phase(self, name):
+        """Этап наполнения: по завершении его скорость пишется в лог."""
+        phase = Phase(name)
+        yield phase
+        phase.add(0)
+        self.phases.append(phase)
+        self.log(str(phase))
+
+    def batches(self, total):
+        """Размеры пачек, на которые делится `total` записей."""
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def create_users(self, count):
+        last_pk = _max_pk(User)
+        # Пароль у всех одинаковый и непригодный для входа:
+        # хешировать пароль для каждого пользователя слишком долго
+        password = make_password(None)
+        prefix = f'seed{self.seed}_{last_pk}_'
+        with self.phase('Пользователи') as phase:
+            for size in self.batches(count):
+                with transaction.atomic():
+                    User.objects.bulk_create([
+                        User(
+                            username=f'{prefix}{phase.count + n}',
+                            first_name=self.faker.first_name(),
+                            last_name=self.faker.last_name(),
+                            password=password,
+                        )
+                        for n in range(size)
+                    ])
+                phase.add(size)
+        self.user_ids = list(User.objects.filter(
+            pk__gt=last_pk
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        last_pk = _max_pk(Group)
+        prefix = f'seed{self.seed}-{last_pk}-'
+        with self.phase('Группы') as phase:
+            groups = [
+                Group(
+                    title=self.faker.sentence(nb_words=3).rstrip('.'),
+                    slug=f'{prefix}{n}',
+                    description=self.faker.text(200),
+                )
+                for n in range(count)
+            ]
+            with transaction.atomic():
+                Group.objects.bulk_create(groups, batch_size=bulk_batch_size(
+                    Group, groups, self.batch_size
+                ))
+            phase.add(len(groups))
+        self.group_ids = list(Group.objects.filter(
+            pk__gt=last_pk
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_follows(self, average):
+        """Подписки со степенным распределением популярности авторов."""
+        authors = self.user_ids
+        weights = zipf_weights(len(authors))
+        follows = []
+        with self.phase('Подписки') as phase:
+            for user_id in self.user_ids:
+                # Число подписок тоже с тяжёлым хвостом, в среднем `average`
+                count = int(self.random.paretovariate(2) * average / 2)
+                count = min(count, len(authors) - 1)
+                chosen = set(self.random.choices(
+                    authors, cum_weights=weights, k=count
+                ))
+                chosen.discard(user_id)
+                follows.extend(
+                    Follow(user_id=user_id, author_id=author_id)
+                    for author_id in sorted(chosen)
+                )
+                if len(follows) >= self.batch_size:
+                    self._save(Follow, follows, phase)
+                    follows = []
+            self._save(Follow, follows, phase)
+
+    def _save(self, model, objs, phase):
+        with transaction.atomic():
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+        phase.add(len(objs))
+
+    def create_images(self):
+        """Небольшой набор картинок, которые делят между собой посты."""
+        with self.phase('Картинки') as phase:
+            for number in range(self.image_pool):
+                color = tuple(self.random.randrange(256) for _ in range(3))
+                buffer = BytesIO()
+                Image.new('RGB', SEED_IMAGE_SIZE, color).save(
+                    buffer, format='JPEG', quality=85, progressive=True
+                )
+                self.images.append(default_storage.save(
+                    f'posts/seed_{self.seed}_{number}.jpg',
+                    ContentFile(buffer.getvalue()),
+                ))
+                phase.add(1)
+
+    def create_posts(self, count, images=0):
+        """Посты в хронологическом порядке за последние `days` дней.
+
+        Самые активные авторы выбираются независимо от самых
+        популярных: иначе раскладка по лентам подписок растёт
+        квадратично и данные перестают быть похожими на настоящие.
+        `images` - доля постов с картинкой.
+        """
+        if images and not self.images:
+            self.create_images()
+        authors = list(self.user_ids)
+        self.random.shuffle(authors)
+        choose_author = self.chooser(authors)
+        choose_group = self.chooser(self.group_ids)
+        start = timezone.now() - timedelta(days=self.days)
+        step = timedelta(days=self.days) / max(count, 1)
+        with self.phase('Посты') as phase, explicit_pub_dates(Post):
+            for size in self.batches(count):
+                posts = [
+                    self.make_post(
+                        start + step * (phase.count + n),
+                        choose_author(),
+                        choose_group(),
+                        images,
+                    )
+                    for n in range(size)
+                ]
+                with transaction.atomic():
+                    Post.objects.bulk_create(posts)
+                phase.add(size)
+
+    def chooser(self, ids):
+        """Случайный выбор из `ids` по степенному закону."""
+        weights = zipf_weights(len(ids))
+        return lambda: (
+            self.random.choices(ids, cum_weights=weights)[0] if ids else None
+        )
+
+    def make_post(self, pub_date, author_id, group_id, images):
+        text = self.faker.text(self.random.choice((80, 200, 500, 1500)))
+        image = ''
+        if self.images and self.random.random() < images:
+            image = self.random.choice(self.images)
+        return Post(
+            author_id=author_id,
+            group_id=group_id if self.random.random() < GROUP_SHARE else None,
+            text=text,
+            excerpt=Post.make_excerpt(text),
+            image=image,
+            pub_date=pub_date,
+        )
+
+    def create_comments(self, average):
+        """Комментарии к новым постам, в среднем `average` на пост."""
+        now = timezone.now()
+        comments = []
+        with self.phase('Комментарии') as phase, explicit_pub_dates(Comment):
+            for batch in self.new_posts('pub_date'):
+                for post in batch:
+                    count = int(self.random.paretovariate(2) * average / 2)
+                    post.comment_count = count
+                    comments.extend(
+                        self.make_comment(post, now) for _ in range(count)
+                    )
+                    if len(comments) >= self.batch_size:
+                        self._save(Comment, comments, phase)
+                        comments = []
+                with transaction.atomic():
+                    Post.objects.bulk_update(batch, ('comment_count',))
+            self._save(Comment, comments, phase)
+
+    def make_comment(self, post, now):
+        delay = timedelta(minutes=self.random.randint(1, 3 * 24 * 60))
+        return Comment(
+            post_id=post.pk,
+            author_id=self.random.choice(self.user_ids),
+            text=self.faker.sentence(),
+            pub_date=min(post.pub_date + delay, now),
+        )
+
+    def new_posts(self, *fields):
+        """Созданные посты пачками по возрастанию pk."""
+        last_pk = self.first_post_pk - 1
+        while True:
+            batch = list(Post.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').only('author_id', *fields)[:self.batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+            yield batch
+
+    def finish(self):
+        """Строит производные данные, которые обычно ведут сигналы."""
+        with self.phase('Счётчики авторов') as phase:
+            phase.add(sum(AuthorStats.objects.reconcile(
+                batch_size=self.batch_size
+            )))
+        with self.phase('Ленты подписок и поисковый индекс') as phase:
+            for batch in self.new_posts('pub_date', 'text'):
+                with transaction.atomic():
+                    TimelineEntry.objects.fan_out(batch)
+                    index_posts(batch)
+                phase.add(len(batch))
+        with self.phase('Миниатюры') as phase:
+            # Не через generate_thumbnails: тот сбрасывает карточку
+            # и ленты каждого поста с картинкой, а новых постов в кеше
+            # ещё нет, и ленты сдвигаются один раз ниже
+            variants = {
+                name: render_thumbnails(name, settings.THUMBNAIL_GEOMETRIES)
+                for name in self.images
+            }
+            for batch in self.new_posts('image'):
+                rows = [
+                    PostImageVariant(post_id=post.pk, **variant)
+                    for post in batch
+                    for variant in variants.get(post.image.name, ())
+                ]
+                with transaction.atomic():
+                    PostImageVariant.objects.bulk_create(
+                        rows, batch_size=bulk_batch_size(
+                            PostImageVariant, rows, self.batch_size
+                        ),
+                    )
+                phase.add(len(rows))
+        bump_feeds([
+            index_scope(),
+            *(group_scope(slug) for slug in Group.objects.filter(
+                pk__in=self.group_ids
+            ).values_list('slug', flat=True)),
+            *(author_scope(username) for username in User.objects.filter(
+                pk__in=self.user_ids
+            ).values_list('username', flat=True)),
+        ])
+
+    def run(self, users, groups, posts, follows, comments=0, images=0):
+        self.create_users(users)
+        self.create_groups(groups)
+        self.create_follows(follows)
+        self.create_posts(posts, images)
+        if comments:
+            self.create_comments(comments)
+        self.finish()
@@ -1,6 +1,39 @@
+import copy
+
 from rest_framework import serializers
 
-from .models import Group, Post, Tag, TagPost
+from .forms import PostForm
+from .models import Comment, Follow, Group, Post, Tag, User
+
+
+class SelectableFieldsMixin:
+    """Оставляет в ответе только поля из параметра ?fields=."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        keep = {name.strip() for name in requested.split(',')}
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+
+class AuthorSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        fields = ('username', 'first_name', 'last_name')
+        model = User
+
+
+class GroupSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+
+    class Meta:
+        fields = ('id', 'title', 'slug', 'description')
+        model = Group
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -8,26 +41,92 @@ class TagSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('name',)
         model = Tag
+        # Существующий тег не ошибка: пост просто привязывается к нему
+        extra_kwargs = {'name': {'validators': []}}
+
+
+class GroupField(serializers.SlugRelatedField):
+    """Группа поста: принимается адрес (slug), отдаётся группа целиком."""
 
-class PostSerializer(serializers.ModelSerializer):
-    group = serializers.SlugRelatedField(slug_field='slug',
-            queryset=Group.objects.all(), required=False)
-    tag = serializers.TagSerializer(many=True, required=False)
+    def __init__(self, **kwargs):
+        kwargs.setdefault('slug_field', 'slug')
+        kwargs.setdefault('queryset', Group.objects.all())
+        super().__init__(**kwargs)
+
+    def to_representation(self, group):
+        return {'title': group.title, 'slug': group.slug}
+
+
+class PostSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    author = AuthorSerializer(read_only=True)
+    group = GroupField(required=False, allow_null=True)
+    tag = TagSerializer(many=True, required=False, source='tags')
 
     class Meta:
-        fields = ('id', 'text', 'author', 'image', 'pub_date', 'group', 'tag')
+        fields = (
+            'id', 'text', 'author', 'image', 'pub_date', 'updated',
+            'group', 'tag', 'comment_count',
+        )
+        read_only_fields = ('pub_date', 'updated', 'comment_count')
         model = Post
 
+    def validate(self, attrs):
+        """Те же правила, что и у формы поста на сайте (PostForm)."""
+        post = self.instance
+        group = attrs.get('group', post.group if post else None)
+        form = PostForm(
+            data={
+                'text': attrs.get('text', post.text if post else ''),
+                'group': group.pk if group else '',
+            },
+            files={'image': attrs['image']} if attrs.get('image') else None,
+            # Копия: форма записывает данные в пост ещё при проверке
+            instance=copy.copy(post),
+        )
+        if not form.is_valid():
+            raise serializers.ValidationError(form.errors)
+        if attrs.get('image'):
+            attrs['image'] = form.cleaned_data['image']
+        return attrs
+
     def create(self, validated_data):
-        if 'tag' not in self.initial_data:
-            post = Post.objects.create(**validated_data)
-            return post
- 
-        tag_data = validated_data.pop('tag')
-        post = Post.objects.create(**validated_data)
-        for tag in tag_data:
-            current_tag, status = Tag.objects.get_or_create(
-                **tag)
-            TagPost.objects.create(
-                tag=current_tag, post=post)
-        return post
\ No newline at end of file
+        tags = validated_data.pop('tags', None)
+        post = super().create(validated_data)
+        if tags:
+            Tag.objects.attach(post, [tag['name'] for tag in tags])
+        return post
+
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        post = super().update(instance, validated_data)
+        if tags is not None:
+            Tag.objects.set_for(post, [tag['name'] for tag in tags])
+        return post
+
+
+class CommentSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    author = AuthorSerializer(read_only=True)
+
+    class Meta:
+        fields = ('id', 'post', 'author', 'text', 'pub_date')
+        read_only_fields = ('post', 'pub_date')
+        model = Comment
+
+
+class FollowSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    author = serializers.SlugRelatedField(
+        slug_field='username', queryset=User.objects.all()
+    )
+
+    class Meta:
+        fields = ('id', 'user', 'author', 'pub_date')
+        read_only_fields = ('pub_date',)
+        model = Follow
+
+    def validate_author(self, author):
+        if author == self.context['request'].user:
+            raise serializers.ValidationError(
+                'Нельзя подписаться на самого себя'
+            )
+        return author
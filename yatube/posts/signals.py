@@ -0,0 +1,252 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import DEFERRED, F
+from django.db.models.functions import Greatest
+from django.core.signals import request_started
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.db import transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+from sorl.thumbnail import default
+
+from .cache import (
+    author_scope, bump_feeds, forget_post_card, group_scope, index_scope
+)
+from .models import (
+    AuthorStats, Comment, Follow, Group, Post, PostImageVariant,
+    TimelineEntry, User
+)
+from .search import index_posts
+from .thumbnails import schedule_thumbnails
+
+# Посты и пользователи, которые сейчас удаляются в этом потоке:
+# их комментарии, посты и подписки уходят каскадом, и обновлять
+# версию удаляемого поста или счётчики удаляемого автора незачем
+_deleting = threading.local()
+
+
+def _deleting_ids(model):
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = {}
+    return _deleting.ids.setdefault(model, set())
+
+
+def bump_post_feeds(author_id, *group_ids):
+    """Устаревают страницы лент, в которые попадает пост"""
+    scopes = [index_scope()]
+    scopes.extend(
+        author_scope(username) for username in User.objects.filter(
+            pk=author_id
+        ).values_list('username', flat=True)
+    )
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if group_ids:
+        scopes.extend(
+            group_scope(slug) for slug in Group.objects.filter(
+                pk__in=group_ids
+            ).values_list('slug', flat=True)
+        )
+    bump_feeds(scopes)
+
+
+def touch_post(comment, **changes):
+    """Сдвигает версию поста после изменения его комментариев"""
+    if Comment.post.is_cached(comment):
+        post = comment.post
+        forget_post_card(post.pk, post.__dict__.get('updated'))
+        author_id, group_id = post.author_id, post.group_id
+    else:
+        author_id, group_id = Post.objects.filter(
+            pk=comment.post_id
+        ).values_list('author_id', 'group_id').first() or (None, None)
+    Post.objects.filter(pk=comment.post_id).update(
+        updated=timezone.now(), **changes
+    )
+    bump_post_feeds(author_id, group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """Сдвигает версию поста при добавлении и правке комментария"""
+    if created:
+        touch_post(instance, comment_count=F('comment_count') + 1)
+    else:
+        # Правка не меняет счётчик, но меняет текст в блоке комментариев
+        touch_post(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def decrease_comment_count(sender, instance, **kwargs):
+    """Уменьшает счётчик комментариев поста при удалении комментария"""
+    if instance.post_id in _deleting_ids(Post):
+        return
+    touch_post(instance, comment_count=Greatest(
+        F('comment_count') - 1, 0
+    ))
+
+
+@receiver(post_init, sender=Post)
+def remember_post_version(sender, instance, **kwargs):
+    """Запоминает версию и группу поста, чтобы заметить их смену"""
+    instance._initial_updated = instance.__dict__.get('updated')
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_text = instance.__dict__.get('text', DEFERRED)
+    # Отложенное поле не читаем: смену картинки тогда не отслеживаем
+    image = instance.__dict__.get('image', DEFERRED)
+    instance._initial_image = getattr(image, 'name', image) or ''
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    """Обновляет счётчики, ленты и кеши при публикации и правке поста"""
+    # Индекс перестраивается, только если текст изменился;
+    # отложенный и не заданный текст не читаем
+    text = instance.__dict__.get('text', DEFERRED)
+    if created or text is not DEFERRED and text != instance._initial_text:
+        index_posts([instance])
+    if created:
+        AuthorStats.objects.change(instance.author_id, posts=1)
+        TimelineEntry.objects.fan_out([instance])
+    else:
+        # Сбрасываем карточку прежней версии отредактированного поста
+        forget_post_card(instance.pk, instance._initial_updated)
+    bump_post_feeds(
+        instance.author_id, instance.group_id, instance._initial_group_id
+    )
+    if instance._initial_image is not DEFERRED:
+        image = instance.image.name or ''
+        if image != instance._initial_image:
+            image_changed(instance, image, created)
+        instance._initial_image = image
+    instance._initial_updated = instance.updated
+    instance._initial_group_id = instance.group_id
+    instance._initial_text = text
+
+
+def image_changed(post, image, created):
+    """Готовит миниатюры новой картинки поста"""
+    if not created:
+        # Варианты прежней картинки больше не подходят к посту
+        PostImageVariant.objects.filter(post=post).delete()
+    if image:
+        # Миниатюры готовятся в фоне, а не при показе ленты. Только
+        # после коммита: иначе фоновый поток не найдёт пост по картинке
+        transaction.on_commit(lambda: schedule_thumbnails(image))
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=User)
+def remember_deleting(sender, instance, **kwargs):
+    """Отмечает пост или пользователя до каскадного удаления"""
+    _deleting_ids(sender).add(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Снимает отметку удаления пользователя"""
+    _deleting_ids(User).discard(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Обновляет счётчик автора, ленты и кеши при удалении поста"""
+    _deleting_ids(Post).discard(instance.pk)
+    if instance.author_id not in _deleting_ids(User):
+        # Статистика удаляемого автора уже удалена каскадом,
+        # пересчёт создал бы её снова для исчезающего автора
+        AuthorStats.objects.change(instance.author_id, posts=-1)
+    forget_post_card(instance.pk, instance.__dict__.get('updated'))
+    bump_post_feeds(instance.author_id, instance.group_id)
+
+
+@receiver(post_init, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    """Запоминает адрес группы, чтобы сбросить ленту и по старому адресу"""
+    instance._initial_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    """Устаревает лента группы при изменении её описания"""
+    bump_feeds([
+        group_scope(slug)
+        for slug in (instance.slug, instance._initial_slug) if slug
+    ])
+    instance._initial_slug = instance.slug
+
+
+def bump_author_feed(author_id):
+    """Устаревает профиль автора: сменилось число подписчиков"""
+    bump_feeds(
+        author_scope(username) for username in User.objects.filter(
+            pk=author_id
+        ).values_list('username', flat=True)
+    )
+
+
+@receiver(post_init, sender=Follow)
+def remember_follow_state(sender, instance, **kwargs):
+    """Запоминает статус отписки, чтобы заметить его смену при сохранении"""
+    # Читаем через __dict__, чтобы не догружать отложенное поле
+    instance._initial_is_deleted = instance.__dict__.get('is_deleted')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    """Обновляет счётчик подписчиков и ленту при подписке и отписке"""
+    initial = instance._initial_is_deleted
+    was_active = not created and initial is False
+    is_active = not instance.is_deleted
+    instance._initial_is_deleted = instance.is_deleted
+    if not instance.author_id or was_active == is_active:
+        return
+    if not created and initial is None:
+        # Прежний статус неизвестен: расхождение исправит сверка
+        return
+    AuthorStats.objects.change(
+        instance.author_id, followers=1 if is_active else -1
+    )
+    bump_author_feed(instance.author_id)
+    if is_active:
+        TimelineEntry.objects.backfill(
+            instance.user_id, [instance.author_id]
+        )
+    else:
+        TimelineEntry.objects.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Уменьшает счётчик подписчиков и чистит ленту при удалении подписки"""
+    if instance.author_id and not instance.is_deleted:
+        if instance.author_id not in _deleting_ids(User):
+            AuthorStats.objects.change(instance.author_id, followers=-1)
+        bump_author_feed(instance.author_id)
+        TimelineEntry.objects.remove(instance.user_id, instance.author_id)
+
+
+@receiver(request_started)
+def forget_prefetched_thumbnails(sender, **kwargs):
+    """Метаданные миниатюр, загруженные прошлым запросом, могли устареть"""
+    forget = getattr(default.kvstore, 'forget_prefetched', None)
+    if forget is not None:
+        forget()
+
+
+@receiver(request_started)
+def forget_deleting(sender, **kwargs):
+    """Отметки сорвавшегося удаления не переходят в новый запрос"""
+    if hasattr(_deleting, 'ids'):
+        _deleting.ids.clear()
+
+
+@receiver(setting_changed)
+def media_root_changed(setting, **kwargs):
+    """Забывает миниатюры, когда тесты подменяют папку медиа"""
+    if setting == 'MEDIA_ROOT':
+        caches[settings.THUMBNAIL_CACHE].clear()
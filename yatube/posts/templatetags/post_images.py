@@ -0,0 +1,45 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post):
+    """Картинка поста со srcset из готовых вариантов.
+
+    Пока вариантов нет, шаблон показывает обычную миниатюру.
+    Варианты берутся через post.image_variants.all(),
+    поэтому в лентах их нужно подгружать prefetch_related.
+    """
+    variants = {}
+    for variant in post.image_variants.all():
+        variants.setdefault(variant.format, []).append(variant)
+    sources = [
+        {
+            'type': f'image/{image_format.lower()}',
+            'srcset': ', '.join(
+                f'{variant.image.url} {variant.width}w'
+                for variant in variants[image_format]
+            ),
+            'variants': variants[image_format],
+        }
+        for image_format in settings.IMAGE_VARIANT_FORMATS
+        if image_format in variants
+    ]
+    # Последний формат - самый совместимый, он же идёт в <img>
+    fallback = sources.pop() if sources else None
+    if fallback:
+        # Для браузеров без srcset - вариант ширины карточки
+        fallback['image'] = min(
+            fallback['variants'],
+            key=lambda variant: abs(
+                variant.width - settings.IMAGE_VARIANT_DEFAULT_WIDTH
+            ),
+        )
+    return {
+        'post': post,
+        'sources': sources,
+        'fallback': fallback,
+        'sizes': settings.IMAGE_VARIANT_SIZES,
+    }
@@ -0,0 +1,218 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..models import Comment, Follow, Group, Post, Tag, User
+from .utils import clear_caches, run_on_commit
+
+
+class PostApiTest(TestCase):
+    """JSON API постов: вложенные данные, курсоры, поля и ETag."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='api_author')
+        cls.other = User.objects.create_user(username='api_other')
+        cls.group = Group.objects.create(
+            title='Группа API', slug='api-group', description='Описание'
+        )
+        for number in range(12):
+            Post.objects.create(
+                author=cls.author if number % 2 else cls.other,
+                group=cls.group if number % 3 else None,
+                text=f'Пост API {number}',
+            )
+        cls.post = Post.objects.filter(author=cls.author).first()
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.list_url = reverse('api:post-list')
+
+    def test_list_is_nested_and_paginated(self):
+        """Автор и группа вложены, следующая страница - по курсору."""
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data['results'][0]
+        self.assertEqual(first['text'], 'Пост API 11')
+        self.assertEqual(first['author']['username'], 'api_author')
+        self.assertEqual(first['group']['slug'], 'api-group')
+        self.assertIsNone(response.data['previous'])
+        second = self.client.get(response.data['next'])
+        texts = [post['text'] for post in second.data['results']]
+        self.assertEqual(texts, ['Пост API 1', 'Пост API 0'])
+        self.assertIsNone(second.data['next'])
+        self.assertIsNotNone(second.data['previous'])
+
+    def test_list_queries_do_not_grow(self):
+        """Авторы и группы не загружаются отдельно для каждого поста."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url)
+        # Посты с авторами и группами и теги всей страницы
+        self.assertLessEqual(len(queries), 2)
+
+    def test_fields_selection(self):
+        response = self.client.get(self.list_url, {'fields': 'id,text'})
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'text'}
+        )
+
+    def test_filters(self):
+        response = self.client.get(
+            self.list_url, {'group': 'api-group', 'author': 'api_author'}
+        )
+        self.assertTrue(response.data['results'])
+        for post in response.data['results']:
+            self.assertEqual(post['author']['username'], 'api_author')
+            self.assertEqual(post['group']['slug'], 'api-group')
+
+    def test_create_post(self):
+        response = self.client.post(
+            self.list_url, {'text': 'Новый пост', 'group': 'api-group'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        post = Post.objects.get(pk=response.data['id'])
+        self.assertEqual(post.author, self.author)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.excerpt, 'Новый пост')
+
+    def test_create_with_tags(self):
+        response = self.client.post(self.list_url, {
+            'text': 'Пост с тегами',
+            'tag': [{'name': 'api'}, {'name': '#Новости'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            set(Tag.objects.filter(
+                posts=response.data['id']
+            ).values_list('name', flat=True)),
+            {'api', 'новости'},
+        )
+        response = self.client.get(self.list_url, {'tag': 'api'})
+        self.assertEqual(
+            [post['text'] for post in response.data['results']],
+            ['Пост с тегами'],
+        )
+        self.assertEqual(
+            response.data['results'][0]['tag'],
+            [{'name': 'api'}, {'name': 'новости'}],
+        )
+
+    def test_create_uses_form_rules(self):
+        """Пустой текст отклоняется так же, как формой на сайте."""
+        response = self.client.post(self.list_url, {'text': '   '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('text', response.data)
+
+    def test_anonymous_cannot_write(self):
+        response = APIClient().post(self.list_url, {'text': 'Аноним'})
+        self.assertIn(response.status_code, (
+            status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN
+        ))
+
+    def test_only_author_edits(self):
+        url = reverse('api:post-detail', args=(self.post.pk,))
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.patch(url, {'text': 'Чужая правка'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.patch(url, {'text': 'Своя правка'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Своя правка')
+        self.assertEqual(self.post.group, self.group)
+
+    def test_etag_not_modified(self):
+        """Повторный запрос с ETag получает 304 без выборки постов."""
+        response = self.client.get(self.list_url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.list_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+        with run_on_commit():
+            self.client.post(self.list_url, {'text': 'Ещё пост'})
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_etag_follows_comments(self):
+        url = reverse('api:post-detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        Comment.objects.create(
+            post=self.post, author=self.other, text='Комментарий'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['comment_count'], 1)
+
+
+class CommentAndFollowApiTest(TestCase):
+    """Комментарии и подписки через JSON API."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='api_writer')
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_comments(self):
+        url = reverse('api:comment-list', args=(self.post.pk,))
+        for number in range(3):
+            response = self.client.post(url, {'text': f'Ответ {number}'})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url)
+        self.assertEqual(
+            [comment['text'] for comment in response.data['results']],
+            ['Ответ 0', 'Ответ 1', 'Ответ 2'],
+        )
+        self.assertEqual(
+            response.data['results'][0]['author']['username'], 'api_reader'
+        )
+
+    def test_comment_edit_changes_etag(self):
+        """Правка комментария сдвигает версию поста и его ETag."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Черновик'
+        )
+        url = reverse('api:comment-list', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(
+            reverse('api:comment-detail', args=(self.post.pk, comment.pk)),
+            {'text': 'Исправлено'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['text'], 'Исправлено')
+        page = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        self.assertContains(page, 'Исправлено')
+
+    def test_follow(self):
+        url = reverse('api:follow-list')
+        response = self.client.post(url, {'author': 'api_writer'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author
+        ).exists())
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['author'], 'api_writer')
+        response = self.client.post(url, {'author': 'api_reader'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            APIClient().get(url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
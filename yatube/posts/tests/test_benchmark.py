@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, models
+from django.db.models import Count
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.middleware import query_budget
+
+from ..models import (
+    AuthorStats, Comment, Follow, Group, Post, PostImageVariant,
+    PostSearchToken, TimelineEntry, User
+)
+from ..benchmark import BENCHMARK_VIEWS, targets
+from ..seeding import Seeder
+from .utils import clear_caches
+
+
+class SeederTest(TestCase):
+    """Синтетические данные вместе с производными данными сигналов."""
+    def test_seed_builds_derived_data(self):
+        Seeder(seed=1, batch_size=7).run(
+            users=12, groups=3, posts=40, follows=3
+        )
+        self.assertEqual(User.objects.count(), 12)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Post.objects.filter(excerpt='').exists())
+        self.assertTrue(PostSearchToken.objects.exists())
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('posts_count', flat=True)),
+            40,
+        )
+        expected_entries = sum(
+            Follow.objects.filter(author=post.author_id).count()
+            for post in Post.objects.all()
+        )
+        self.assertEqual(TimelineEntry.objects.count(), expected_entries)
+        # Даты разнесены по времени, а не равны моменту вставки
+        dates = Post.objects.order_by('pk').values_list('pub_date', flat=True)
+        self.assertLess(dates[0], dates[len(dates) - 1])
+
+    def test_seed_is_deterministic(self):
+        def seed():
+            first_pk = (Post.objects.order_by('-pk').values_list(
+                'pk', flat=True
+            ).first() or 0)
+            Seeder(seed=5).run(users=5, groups=2, posts=10, follows=2)
+            return list(Post.objects.filter(pk__gt=first_pk).order_by(
+                'pk'
+            ).values_list('group__title', 'text'))
+        self.assertEqual(seed(), seed())
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=0
+)
+class SeedYatubeCommandTest(TestCase):
+    """Команда seed_yatube: комментарии, картинки и отчёт о скорости."""
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_seed_comments_and_images(self):
+        output = StringIO()
+        call_command(
+            'seed_yatube', '--users=6', '--groups=2', '--posts=20',
+            '--comments=4', '--images=0.5', '--image-pool=2',
+            '--batch-size=8', stdout=output,
+        )
+        self.assertIn('в секунду', output.getvalue())
+        self.assertTrue(Comment.objects.exists())
+        # Счётчики комментариев совпадают с самими комментариями
+        self.assertFalse(
+            Post.objects.annotate(
+                comments_total=Count('comments')
+            ).exclude(comment_count=models.F('comments_total')).exists()
+        )
+        with_images = Post.objects.exclude(image='')
+        self.assertTrue(with_images.exists())
+        self.assertEqual(
+            with_images.values('image').distinct().count(),
+            2,
+        )
+        self.assertFalse(
+            with_images.filter(image_variants__isnull=True).exists()
+        )
+        self.assertFalse(PostImageVariant.objects.filter(
+            post__image=''
+        ).exists())
+
+    def test_images_bump_feeds_once(self):
+        """Посты с картинками не сдвигают ленты по одному."""
+        with mock.patch('posts.cache._bump_feeds') as bump:
+            Seeder(seed=2, image_pool=2).run(
+                users=4, groups=1, posts=10, follows=1, images=1
+            )
+        bump.assert_called_once()
+        self.assertEqual(
+            PostImageVariant.objects.values('post').distinct().count(), 10
+        )
+
+    def test_invalid_share(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_yatube', '--images=2', stdout=StringIO())
+
+
+class BenchmarkFeedsTest(TestCase):
+    """Команда benchmark_feeds замеряет ленты и сравнивает с базовыми."""
+    def setUp(self):
+        clear_caches()
+
+    def test_benchmark_reports_views(self):
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command(
+                'benchmark_feeds', '--seed-data', '--users=8',
+                '--groups=2', '--posts=30', '--follows=3', '--samples=2',
+                f'--save={path}', stdout=output,
+            )
+            with open(path) as file:
+                results = json.load(file)
+        for view in ('index', 'group_posts', 'profile', 'post_detail',
+                     'follow_index'):
+            with self.subTest(view=view):
+                self.assertIn(f'{view}: p50', output.getvalue())
+                self.assertGreater(results[view]['queries'], 0)
+
+    def test_regression_fails(self):
+        Seeder().run(users=4, groups=1, posts=5, follows=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            with open(path, 'w') as file:
+                json.dump({'index': {'p95': 1000, 'queries': 0}}, file)
+            with self.assertRaisesMessage(CommandError, 'index: запросов'):
+                call_command(
+                    'benchmark_feeds', 'index', '--samples=1',
+                    f'--baseline={path}', stdout=StringIO(),
+                )
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=0
+)
+class QueryBudgetTest(TestCase):
+    """Ленты без кеша укладываются в бюджеты запросов QUERY_BUDGETS."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        clear_caches()
+        Seeder(seed=1, image_pool=2).run(
+            users=10, groups=2, posts=30, follows=3, comments=3, images=0.5
+        )
+        cls.viewer = User.objects.order_by('pk').first()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_views_within_budget(self):
+        for view, url_name in BENCHMARK_VIEWS.items():
+            budget = query_budget(url_name)
+            for url, user in targets(view, random.Random(0), 5):
+                client = Client()
+                client.force_login(user or self.viewer)
+                # Страница строится заново, миниатюры уже готовы
+                caches['posts'].clear()
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                with self.subTest(url=url):
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(len(captured), budget)
@@ -0,0 +1,110 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..exporting import EXPORTS
+from ..importing import PostImporter, read_records
+from ..models import Comment, Follow, Group, Post, Tag, User
+
+
+class ExportTest(TestCase):
+    """Выгрузка страницами: команда export_yatube и API."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='exporter')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export-group', description='Описание'
+        )
+        for number in range(5):
+            post = Post.objects.create(
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+                text=f'Пост {number}',
+            )
+            Tag.objects.attach(post, ['выгрузка', f'тег{number}'])
+        cls.post = post
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        Comment.objects.create(post=post, author=cls.other, text='Коммент')
+        Follow.objects.create(user=cls.author, author=cls.other)
+        Follow.objects.create(user=cls.other, author=cls.author)
+
+    def export(self, *args):
+        output = StringIO()
+        call_command('export_yatube', *args, stdout=output)
+        return output.getvalue()
+
+    def test_jsonl_posts(self):
+        lines = self.export('posts', '--user=exporter').splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [record['text'] for record in records],
+            [f'Пост {number}' for number in range(5)],
+        )
+        self.assertEqual(records[1]['group'], 'export-group')
+        self.assertEqual(records[1]['tags'], ['выгрузка', 'тег1'])
+        self.assertEqual(records[0]['author'], 'exporter')
+
+    def test_csv_round_trip(self):
+        """Выгруженные посты загружаются обратно командой импорта."""
+        lines = self.export('posts', '--format=csv', '--chunk-size=2')
+        importer = PostImporter().run(
+            read_records(StringIO(lines), 'csv')
+        )
+        self.assertEqual(importer.errors, [])
+        copy = Post.objects.order_by('-pk').first()
+        self.assertEqual(copy.text, 'Чужой пост')
+        self.assertEqual(Tag.objects.get(name='выгрузка').posts.count(), 10)
+
+    def test_comments_and_follows(self):
+        comment = json.loads(self.export('comments'))
+        self.assertEqual(comment['post'], self.post.pk)
+        self.assertEqual(comment['author'], 'other')
+        follows = self.export('follows', '--user=exporter').splitlines()
+        self.assertEqual(len(follows), 1)
+        self.assertEqual(json.loads(follows[0])['author'], 'other')
+
+    def test_page_queries(self):
+        """Каждая страница постов - два запроса, сколько бы их ни было."""
+        with CaptureQueriesContext(connection) as queries:
+            records = list(EXPORTS['posts'].records(chunk_size=2))
+        self.assertEqual(len(records), 6)
+        # Три страницы по два запроса и пустая последняя
+        self.assertEqual(len(queries), 7)
+
+    def test_api_streams_own_data(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.get(
+            reverse('api:export-detail', args=('posts',)), {'output': 'csv'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('posts.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(
+            b''.join(response.streaming_content).decode()
+        )))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['tags'], 'выгрузка,тег0')
+
+    def test_api_requires_login(self):
+        response = APIClient().get(
+            reverse('api:export-detail', args=('follows',))
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_api_unknown_format(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.get(
+            reverse('api:export-detail', args=('posts',)), {'output': 'xml'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,10 +1,13 @@
 from django.test import TestCase
 from posts.forms import PostForm, CommentForm
 from posts.models import Post, Group, Comment, User
+from posts.tests.utils import run_on_commit
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from io import BytesIO
+from PIL import Image
 import shutil
 import tempfile
 
@@ -15,8 +18,9 @@ TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 # Для сохранения media-файлов в тестах будет использоваться
-# временная папка TEMP_MEDIA_ROOT, а потом мы ее удалим
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# временная папка TEMP_MEDIA_ROOT, а потом мы ее удалим. Миниатюры
+# готовятся сразу: фоновые потоки писали бы в уже удалённую папку
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostCreateFormTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -145,10 +149,11 @@ class PostCreateFormTest(TestCase):
             description='Special new group for testing edit-form'
         )
         form_data = {'text': new_post_text, 'group': new_group.pk}
-        response = self.authorized_client.post(
-            reverse('posts:post_edit', args={second_post.pk}),
-            data=form_data, follow=True,
-        )
+        with run_on_commit():
+            response = self.authorized_client.post(
+                reverse('posts:post_edit', args={second_post.pk}),
+                data=form_data, follow=True,
+            )
         # Проверяем, сработал ли редирект
         self.assertRedirects(
             response, reverse(
@@ -285,3 +290,70 @@ class PostCreateFormTest(TestCase):
         self.assertEqual(
             PostCreateFormTest.form_comment.fields['text'].help_text, expected
         )
+
+
+class PostImageFieldTest(TestCase):
+    """Картинка нормализуется и проверяется до сохранения в MEDIA_ROOT."""
+
+    @staticmethod
+    def upload(size=(50, 50), image_format='JPEG', name='photo.jpg', **save):
+        file_obj = BytesIO()
+        Image.new('RGB', size, (200, 50, 50)).save(
+            file_obj, image_format, **save
+        )
+        return SimpleUploadedFile(
+            name=name, content=file_obj.getvalue(), content_type='image/jpeg'
+        )
+
+    def clean(self, uploaded):
+        form = PostForm(data={'text': 'Текст'}, files={'image': uploaded})
+        form.is_valid()
+        return form
+
+    def test_large_photo_normalized(self):
+        """Большое фото уменьшается, теряет EXIF и становится progressive."""
+        exif = Image.Exif()
+        # 0x010F - производитель камеры
+        exif[0x010F] = 'Camera'
+        uploaded = self.upload(
+            size=(400, 200), exif=exif.tobytes(), name='photo.jpeg'
+        )
+        with override_settings(IMAGE_MAX_DIMENSION=100):
+            form = self.clean(uploaded)
+        self.assertTrue(form.is_valid(), form.errors)
+        image_file = form.cleaned_data['image']
+        self.assertEqual(image_file.name, 'photo.jpg')
+        with Image.open(image_file) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn('exif', image.info)
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_normal_image_kept(self):
+        """Небольшая картинка без метаданных сохраняется как есть."""
+        uploaded = self.upload(image_format='PNG', name='pic.png')
+        form = self.clean(uploaded)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data['image'], uploaded)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с огромным числом точек отклоняется."""
+        form = self.clean(self.upload(size=(50, 50)))
+        self.assertEqual(form.errors['image'][0], (
+            'Слишком большое изображение: 50×50 точек.'
+        ))
+
+    @override_settings(IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_large_file_rejected(self):
+        """Слишком большой файл отклоняется без открытия картинки."""
+        form = self.clean(self.upload(size=(200, 200)))
+        self.assertIn('image', form.errors)
+        self.assertIn('Файл слишком большой', form.errors['image'][0])
+
+    @override_settings(IMAGE_UPLOAD_FORMATS=('PNG',))
+    def test_format_rejected(self):
+        """Картинка неразрешённого формата отклоняется."""
+        form = self.clean(self.upload())
+        self.assertEqual(
+            form.errors['image'][0], 'Формат JPEG не поддерживается.'
+        )
@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..importing import PostImporter
+from ..models import (
+    AuthorStats, Follow, Group, Post, PostSearchToken, TimelineEntry, User
+)
+from .utils import clear_caches
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.new('RGB', (20, 10), 'red').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=0
+)
+class ImportPostsCommandTest(TestCase):
+    """Команда import_posts: проверка записей и производные данные."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        with open(os.path.join(cls.source, 'cat.jpg'), 'wb') as image:
+            image.write(jpeg_bytes())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.source, ignore_errors=True)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='importer')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(
+            title='Архив', slug='archive', description='Старые посты'
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def import_posts(self, path, *args):
+        errors = StringIO()
+        call_command(
+            'import_posts', path, *args, stdout=StringIO(), stderr=errors
+        )
+        return errors.getvalue()
+
+    def test_jsonl_import(self):
+        records = [
+            {'text': 'Пост из архива', 'author': 'importer',
+             'group': 'archive',
+             'tags': ['архив', '#Старое'], 'image': 'cat.jpg',
+             'pub_date': '2015-03-01T12:00:00'},
+            {'text': 'Второй пост', 'author': 'importer'},
+            {'text': '   ', 'author': 'importer'},
+            {'text': 'Без группы', 'author': 'importer', 'group': 'nope'},
+            {'text': 'Чужая картинка', 'author': 'importer',
+             'image': '../secret.jpg'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join([
+            *map(json.dumps, records), 'не JSON',
+        ]))
+        errors = self.import_posts(path, '--batch-size=2')
+        for line in (3, 4, 5, 6):
+            self.assertIn(f'Строка {line}:', errors)
+        self.assertEqual(Post.objects.count(), 2)
+        post = Post.objects.get(text='Пост из архива')
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.excerpt, 'Пост из архива')
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertEqual(
+            list(post.tags.values_list('name', flat=True)),
+            ['архив', 'старое'],
+        )
+        self.assertTrue(PostSearchToken.objects.filter(post=post).exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).posts_count, 2
+        )
+        self.assertContains(
+            self.client.get(reverse('posts:index')), 'Второй пост'
+        )
+
+    def test_csv_import_with_author(self):
+        path = self.write(
+            'posts.csv',
+            'text,group,tags\n'
+            'Пост из CSV,archive,"csv, импорт"\n'
+            '"Многострочный\nпост",,\n',
+        )
+        self.import_posts(path, '--author=importer')
+        self.assertEqual(
+            self.group.posts.get().tags.count(), 2
+        )
+        self.assertTrue(Post.objects.filter(
+            author=self.author, text='Многострочный\nпост'
+        ).exists())
+
+    def test_queries_do_not_grow(self):
+        """Пачка из 20 постов стоит столько же запросов, сколько из 2."""
+        counts = []
+        # Первая пачка ещё создаёт тег и счётчики автора
+        for total in (1, 2, 20):
+            records = [
+                (number, {'text': f'Пост {number}', 'group': 'archive',
+                          'tags': ['пачка']})
+                for number in range(total)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                PostImporter(author=self.author).run(records)
+            counts.append(len(queries))
+        self.assertEqual(counts[1], counts[2])
+
+    def test_unknown_author(self):
+        path = self.write('empty.jsonl', '')
+        with self.assertRaises(CommandError):
+            self.import_posts(path, '--author=nobody')
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=0
+)
+class ImportPostsApiTest(TestCase):
+    """Пачка постов через API: от имени текущего пользователя."""
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='api_importer')
+        cls.url = reverse('api:post-import-posts')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_json_records(self):
+        response = self.client.post(self.url, [
+            {'text': 'Первый', 'author': 'someone_else'},
+            {'text': ''},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 2)
+        self.assertEqual(Post.objects.get().author, self.author)
+
+    def test_file_with_images(self):
+        lines = '\n'.join(json.dumps(record) for record in [
+            {'text': 'С картинкой', 'image': 'cat.jpg'},
+            {'text': 'Та же картинка', 'image': 'cat.jpg'},
+        ])
+        response = self.client.post(self.url, {
+            'file': SimpleUploadedFile('posts.jsonl', lines.encode()),
+            'cat.jpg': SimpleUploadedFile('cat.jpg', jpeg_bytes()),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Post.objects.exclude(image='').count(), 2)
+
+    @override_settings(IMPORT_MAX_RECORDS=3, IMPORT_BATCH_SIZE=2)
+    def test_limit_checked_before_import(self):
+        """Слишком большой импорт не сохраняет даже первые пачки."""
+        response = self.client.post(self.url, [
+            {'text': f'Пост {number}'} for number in range(4)
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+        self.assertFalse(Post.objects.exists())
+
+    def test_wrong_field_types(self):
+        """Теги не того типа и несуществующая дата - ошибки записей."""
+        response = self.client.post(self.url, [
+            {'text': 'Числовые теги', 'tags': 5},
+            {'text': 'Неверная дата', 'pub_date': '2020-13-45T00:00:00'},
+            {'text': 'Верный пост', 'tags': ['теги', 2020]},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        errors = {error['line']: error['errors'] for error in
+                  response.data['errors']}
+        self.assertIn('tags', errors[1])
+        self.assertIn('pub_date', errors[2])
+        self.assertEqual(Post.objects.get().tags.count(), 2)
+
+    def test_nothing_imported(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_anonymous(self):
+        response = APIClient().post(self.url, [{'text': 'Пост'}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
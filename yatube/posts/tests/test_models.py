@@ -1,7 +1,15 @@
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, Comment, Follow
+from ..models import (
+    AuthorStats, Group, Post, Comment, Follow, Tag, TimelineEntry
+)
 
 User = get_user_model()
 
@@ -32,6 +40,16 @@ class PostModelTest(TestCase):
             is_deleted=False,
         )
 
+    def test_excerpt_maintained_on_save(self):
+        """Отрывок для ленты пересчитывается при сохранении текста."""
+        post = Post.objects.create(author=self.user, text='Слово ' * 200)
+        self.assertEqual(post.excerpt, Post.make_excerpt(post.text))
+        self.assertLessEqual(len(post.excerpt), settings.POST_EXCERPT_LENGTH)
+        post.text = 'Короткий текст'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt, 'Короткий текст')
+
     def test_model_object_name(self):
         """Проверяем, что у моделей корректно работает __str__."""
         post = PostModelTest.post
@@ -123,3 +141,164 @@ class PostModelTest(TestCase):
         self.assertEqual(
             comment._meta.get_field('text').help_text, expected_value
         )
+
+    def test_comment_count(self):
+        """Счётчик комментариев поста следует за комментариями."""
+        post = Post.objects.create(author=self.user, text='Пост со счётчиком')
+        comment = Comment.objects.create(
+            post=post, author=self.user_2, text='Первый'
+        )
+        Comment.objects.create(post=post, author=self.user, text='Второй')
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def commented_post(self, comments):
+        post = Post.objects.create(author=self.user, text='Обсуждаемый пост')
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.user_2, text=f'Коммент {i}')
+            for i in range(comments)
+        ])
+        return post
+
+    def test_post_delete_skips_comment_signals(self):
+        """Удаление поста не трогает его версию на каждый комментарий."""
+        post = self.commented_post(1)
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        post = self.commented_post(20)
+        with self.assertNumQueries(len(queries)):
+            post.delete()
+        # Комментарии к другим постам по-прежнему сдвигают счётчик
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        comment = Comment.objects.create(
+            post=other, author=self.user_2, text='Остаётся'
+        )
+        comment.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.comment_count, 0)
+
+    def test_author_stats(self):
+        """Счётчики автора следуют за постами и подписками."""
+        author = User.objects.create_user(username='stats_author')
+        post = Post.objects.create(author=author, text='Первый пост')
+        Post.objects.create(author=author, text='Второй пост')
+        follow = Follow.objects.create(user=self.user, author=author)
+        Follow.objects.create(user=self.user_2, author=author)
+        stats = AuthorStats.objects.get(author=author)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.followers_count, 2)
+        post.delete()
+        follow.is_deleted = True
+        follow.save()
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+
+    def test_delete_author_with_posts(self):
+        """Удаление автора с постами не создаёт его статистику заново."""
+        author = User.objects.create_user(username='leaving_author')
+        post = Post.objects.create(author=author, text='Пост автора')
+        Post.objects.create(author=author, text='Ещё пост')
+        Comment.objects.create(post=post, author=self.user, text='Коммент')
+        Follow.objects.create(user=self.user, author=author)
+        followers = AuthorStats.objects.for_author(self.user_2)
+        Follow.objects.create(user=author, author=self.user_2)
+        author.delete()
+        self.assertFalse(AuthorStats.objects.filter(author_id=author.pk))
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.user_2).followers_count,
+            followers.followers_count,
+        )
+
+    def test_reconcile_author_stats(self):
+        """Команда сверки исправляет разошедшиеся счётчики."""
+        AuthorStats.objects.filter(author=self.user).update(
+            posts_count=100, followers_count=100
+        )
+        AuthorStats.objects.filter(author=self.user_2).delete()
+        call_command('reconcile_author_stats', stdout=StringIO())
+        stats = AuthorStats.objects.in_bulk([self.user.pk, self.user_2.pk])
+        self.assertEqual(stats[self.user.pk].posts_count, 1)
+        self.assertEqual(stats[self.user.pk].followers_count, 0)
+        self.assertEqual(stats[self.user_2.pk].posts_count, 0)
+        self.assertEqual(stats[self.user_2.pk].followers_count, 1)
+
+    def test_timeline_fan_out(self):
+        """Посты автора попадают в ленту подписчика и уходят при отписке."""
+        author = User.objects.create_user(username='timeline_author')
+        old_post = Post.objects.create(author=author, text='До подписки')
+        follow = Follow.objects.create(user=self.user, author=author)
+        new_post = Post.objects.create(author=author, text='После подписки')
+        self.assertEqual(
+            list(TimelineEntry.objects.feed(self.user).values_list(
+                'post', flat=True
+            )),
+            [new_post.pk, old_post.pk],
+        )
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_timeline_celebrity_pull(self):
+        """Посты популярного автора подтягиваются в ленту при чтении."""
+        author = User.objects.create_user(username='celebrity_author')
+        Follow.objects.create(user=self.user, author=author)
+        post = Post.objects.create(author=author, text='Пост звезды')
+        self.assertFalse(TimelineEntry.objects.filter(post=post))
+        TimelineEntry.objects.pull_celebrities(self.user)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post)
+        )
+
+
+class TagModelTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tag_author')
+
+    def test_attach_normalizes_names(self):
+        """Имена тегов очищаются от решётки, пробелов и повторов."""
+        post = Post.objects.create(author=self.user, text='Пост с тегами')
+        Tag.objects.attach(post, ['#Python', ' python ', 'Django', ''])
+        self.assertEqual(
+            list(post.tags.values_list('name', flat=True)),
+            ['django', 'python'],
+        )
+
+    def test_attach_queries_do_not_grow(self):
+        """Привязка 20 тегов стоит столько же запросов, сколько двух."""
+        Tag.objects.create(name='tag0')
+        counts = []
+        for total in (2, 20):
+            post = Post.objects.create(author=self.user, text='Пост')
+            with CaptureQueriesContext(connection) as queries:
+                Tag.objects.attach(
+                    post, [f'tag{number}' for number in range(total)]
+                )
+            counts.append(len(queries))
+            self.assertEqual(post.tags.count(), total)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_attach_many_posts(self):
+        posts = [
+            Post.objects.create(author=self.user, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Tag.objects.attach_many(
+            (post, ['общий', f'свой{number}'])
+            for number, post in enumerate(posts)
+        )
+        self.assertEqual(Tag.objects.get(name='общий').posts.count(), 3)
+        self.assertEqual(Tag.objects.count(), 4)
+
+    def test_set_for_replaces_tags(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        Tag.objects.attach(post, ['старый', 'общий'])
+        Tag.objects.set_for(post, ['общий', 'новый'])
+        self.assertEqual(
+            list(post.tags.values_list('name', flat=True)),
+            ['новый', 'общий'],
+        )
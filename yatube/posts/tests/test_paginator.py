@@ -1,6 +1,6 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
-from ..models import Group, Post
+from ..models import Follow, Group, Post, TimelineEntry
 from django.urls import reverse
 from django.conf import settings
 
@@ -88,3 +88,75 @@ class PaginatorViewsTest(TestCase):
                     response.context['page_obj']
                 ), (13 - settings.QUANTITY_PAGINATE)
                 )
+
+
+class CursorPaginatorViewsTest(TestCase):
+    """Курсорная навигация по ленте подписок."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='cursor-author')
+        cls.reader = User.objects.create_user(username='cursor-reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        # Одинаковая дата у всех постов: порядок держится на id
+        Post.objects.bulk_create([
+            Post(text=f'Пост номер {i}', author=cls.author)
+            for i in range(13)
+        ])
+        Post.objects.filter(author=cls.author).update(
+            pub_date=Post.objects.first().pub_date
+        )
+        # bulk_create не шлёт сигналов: раскладываем посты по лентам сами
+        TimelineEntry.objects.fan_out(Post.objects.filter(author=cls.author))
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_follow_index_uses_cursor_pages(self):
+        """Лента подписок листается курсором вперёд и назад."""
+        url = reverse('posts:follow_index')
+        first_page = self.authorized_client.get(url).context['page_obj']
+        self.assertTrue(first_page.paginator.is_cursor)
+        self.assertEqual(len(first_page), settings.QUANTITY_PAGINATE)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+
+        second_page = self.authorized_client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            len(second_page), 13 - settings.QUANTITY_PAGINATE
+        )
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        # Условные номера не ломают методы Page, которым нужен count
+        self.assertEqual(second_page.start_index(), 11)
+        self.assertEqual(second_page.end_index(), 13)
+        self.assertEqual(list(second_page.paginator.page_range), [1, 2])
+        seen = [post.pk for post in first_page] + [
+            post.pk for post in second_page
+        ]
+        expected = list(
+            TimelineEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True
+            )
+        )
+        self.assertEqual(seen, expected)
+
+        back_page = self.authorized_client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in back_page],
+            [post.pk for post in first_page],
+        )
+
+    def test_follow_index_ignores_broken_cursor(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), settings.QUANTITY_PAGINATE
+        )
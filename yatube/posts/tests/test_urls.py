@@ -1,8 +1,8 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from ..models import Group, Post, Comment, Follow
+from .utils import clear_caches
 from http import HTTPStatus
-from django.core.cache import cache
 
 User = get_user_model()
 
@@ -46,7 +46,7 @@ class PostURLTest(TestCase):
         self.authorized_client.force_login(self.user)
         self.author = Client()
         self.author.force_login(PostURLTest.user)
-        cache.clear()
+        clear_caches()
 
     def test_urls_for_anonymous(self):
         """Проверка доступа ко всем страницам для
@@ -1,21 +1,60 @@
-from django.test import TestCase, Client, override_settings
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
 from django.contrib.auth import get_user_model
-from ..models import Group, Post, User, Follow, Comment
+from ..cache import (
+    FEED_MODIFIED_KEY, author_scope, bump_feeds, cached_response,
+    feed_generations, index_scope, scope_key, tag_scope
+)
+from ..models import (
+    Group, Post, PostImageVariant, User, Follow, Comment, Tag
+)
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django import forms
 from http import HTTPStatus
 from django.conf import settings
+from io import BytesIO, StringIO
+from datetime import timedelta
+import re
+import time
+import warnings
 import shutil
 import tempfile
-from django.core.cache import cache
+from django.core.cache import caches
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+from unittest import mock
+from ..thumbnails import (
+    generate_thumbnails, schedule_thumbnails, variant_formats,
+    wait_thumbnails
+)
+from .utils import clear_caches, run_on_commit
+from PIL import Image
 
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Картинка из двух пикселей: белого и чёрного
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# Миниатюры готовятся сразу: фоновые потоки писали бы
+# в уже удалённую TEMP_MEDIA_ROOT
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostViewTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -80,7 +119,7 @@ class PostViewTest(TestCase):
         self.authorized_client.force_login(self.user)
         self.author = Client()
         self.author.force_login(PostViewTest.user)
-        cache.clear()
+        clear_caches()
 
     def test_reverse_name_template(self):
         """URL-адрес через namespace:
@@ -336,16 +375,46 @@ class PostViewTest(TestCase):
         """Проверка работы кеширования заглавной страницы index."""
         response_first = self.author.get(reverse('posts:index'))
         first_posts = response_first.content
-        Post.objects.all().delete()
+        # Изменение в обход сигналов не сбрасывает кеш страницы
+        Post.objects.filter(pk=PostViewTest.post.pk).update(
+            text='Правка в обход сигналов',
+            excerpt='Правка в обход сигналов',
+        )
         response_second = self.author.get(reverse('posts:index'))
         second_posts = response_second.content
         self.assertEqual(first_posts, second_posts)
-        """self.assertTrue(cache.get('index_page'))"""
-        cache.clear()
+        clear_caches()
         response_third = self.author.get(reverse('posts:index'))
         third_posts = response_third.content
         self.assertNotEqual(first_posts, third_posts)
 
+    def test_cache_index_invalidated_on_delete(self):
+        """Удаление постов сразу сбрасывает кеш заглавной страницы."""
+        response_first = self.author.get(reverse('posts:index'))
+        with run_on_commit():
+            Post.objects.all().delete()
+        response_second = self.author.get(reverse('posts:index'))
+        self.assertNotEqual(response_first.content, response_second.content)
+        self.assertNotContains(response_second, PostViewTest.post.text)
+
+    def test_cache_feeds_invalidated_on_create(self):
+        """Новый пост сразу виден в закешированных лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(PostViewTest.group.slug,)),
+            reverse('posts:profile', args=(PostViewTest.user.username,)),
+        )
+        for url in urls:
+            self.author.get(url)
+        with run_on_commit():
+            self.author.post(
+                reverse('posts:post_create'),
+                data={'text': 'Свежий пост', 'group': PostViewTest.group.pk},
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.author.get(url), 'Свежий пост')
+
     def test_follow_user(self):
         """Авторизированный пользователь может
         подписываться на других пользователей.
@@ -520,3 +589,666 @@ class PostViewTest(TestCase):
         self.assertContains(self.authorized_client.get(
             reverse('posts:follow_index')
         ), self.new_post.text, 0)
+
+
+class FeedQueryCountTest(TestCase):
+    """Число запросов ленты не зависит от количества постов на странице."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.reader = User.objects.create_user(username='feed_reader')
+        cls.group = Group.objects.create(
+            title='Группа ленты',
+            slug='feed-slug',
+            description='Группа для подсчёта запросов',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+        clear_caches()
+
+    def create_commented_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+            Comment.objects.create(
+                post=post, author=self.reader, text=f'Комментарий {i}'
+            )
+
+    def count_queries(self, url):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(queries)
+
+    def test_feed_query_budget(self):
+        """Страница ленты рендерится за постоянное число запросов."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': self.author.username
+            }),
+            reverse('posts:follow_index'),
+        )
+        self.create_commented_posts(2)
+        few_posts = {url: self.count_queries(url) for url in urls}
+        self.create_commented_posts(settings.QUANTITY_PAGINATE)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few_posts[url])
+
+    def test_feed_view_queries(self):
+        """Число запросов каждой ленты не растёт незаметно."""
+        self.create_commented_posts(settings.QUANTITY_PAGINATE)
+        # Сессия и пользователь - 2 запроса, дальше запросы самой ленты
+        budgets = {
+            reverse('posts:index'): 5,
+            reverse('posts:index') + '?q=Пост': 5,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 6,
+            reverse('posts:profile', kwargs={
+                'username': self.author.username
+            }): 8,
+            reverse('posts:follow_index'): 5,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), budget)
+        # Последние комментарии подгружаются одним запросом на страницу
+        with self.settings(FEED_LATEST_COMMENTS=2):
+            for url, budget in budgets.items():
+                with self.subTest(url=url, comments=2):
+                    self.assertEqual(self.count_queries(url), budget + 1)
+
+    def test_feed_shows_latest_comments(self):
+        """Карточка показывает последние комментарии к посту."""
+        self.create_commented_posts(1)
+        post = Post.objects.get()
+        for i in range(1, 4):
+            Comment.objects.create(
+                post=post, author=self.reader, text=f'Ещё комментарий {i}'
+            )
+        with self.settings(FEED_LATEST_COMMENTS=2):
+            clear_caches()
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Ещё комментарий 3')
+        self.assertContains(response, 'Ещё комментарий 2')
+        self.assertNotContains(response, 'Ещё комментарий 1')
+        self.assertNotContains(response, 'Комментарий 0')
+
+    def test_feed_projection(self):
+        """Лента берёт отрывок, а не весь текст и не все поля автора."""
+        long_text = 'Очень длинный пост. ' * 100
+        Post.objects.create(author=self.author, text=long_text)
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        feed_query = next(
+            query['sql'] for query in queries
+            if 'FROM "posts_post"' in query['sql']
+            and '"posts_post"."excerpt"' in query['sql']
+        )
+        self.assertNotIn('"posts_post"."text"', feed_query)
+        self.assertNotIn('password', feed_query)
+        self.assertContains(response, Post.make_excerpt(long_text))
+        self.assertNotContains(response, long_text)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_pull_throttled(self):
+        """Посты популярных авторов догружаются не на каждый запрос."""
+        url = reverse('posts:follow_index')
+        first = Post.objects.create(author=self.author, text='Первый')
+        self.assertContains(self.client.get(url), first.text)
+        second = Post.objects.create(author=self.author, text='Второй')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertNotContains(self.client.get(url), second.text)
+        self.assertFalse(any(
+            'posts_follow' in query['sql'] for query in queries
+        ))
+        caches['posts'].clear()
+        self.assertContains(self.client.get(url), second.text)
+
+    def test_feed_shows_comment_count(self):
+        """Лента показывает денормализованный счётчик комментариев."""
+        self.create_commented_posts(1)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'комментарии (1)')
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент сортируются по индексу, а не во временной таблице."""
+        self.create_commented_posts(3)
+        output = StringIO()
+        call_command('explain_feeds', '--check', '--repeat=1', stdout=output)
+        self.assertIn('follow_index', output.getvalue())
+
+
+class PostCardCacheTest(TestCase):
+    """Кеш карточек постов сбрасывается при правке и комментариях."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='card_author')
+        cls.group = Group.objects.create(
+            title='Группа карточек',
+            slug='card-slug',
+            description='Группа для проверки кеша карточек',
+        )
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.author)
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Исходный текст'
+        )
+        self.url = reverse('posts:group_list', args=(self.group.slug,))
+
+    def test_card_is_cached(self):
+        """Карточка берётся из кеша, пока версия поста не менялась."""
+        self.client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        self.assertContains(self.client.get(self.url), 'Исходный текст')
+
+    def test_card_refreshed_after_edit(self):
+        """Правка поста сразу видна в ленте."""
+        self.client.get(self.url)
+        with run_on_commit():
+            self.client.post(
+                reverse('posts:post_edit', args=(self.post.pk,)),
+                data={'text': 'Новый текст', 'group': self.group.pk},
+            )
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Исходный текст')
+
+    def test_card_refreshed_after_comment(self):
+        """Новый комментарий сразу меняет счётчик на карточке."""
+        self.client.get(self.url)
+        with run_on_commit():
+            self.client.post(
+                reverse('posts:add_comment', args=(self.post.pk,)),
+                data={'text': 'Комментарий'},
+            )
+        self.assertContains(self.client.get(self.url), 'комментарии (1)')
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class PostCommentsTest(TestCase):
+    """Комментарии поста листаются курсором и кешируются блоком."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='comments_author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for number in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {number}'
+            )
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.author)
+        self.url = reverse('posts:post_detail', args=(self.post.pk,))
+
+    def test_comments_paginated_by_cursor(self):
+        """Страницы идут от старых комментариев к новым без пропусков."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Комментарий 0')
+        self.assertContains(response, 'Комментарий 1')
+        self.assertNotContains(response, 'Комментарий 2')
+        seen = []
+        cursor = ''
+        while True:
+            page = self.client.get(self.url, {'cursor': cursor})
+            seen.extend(
+                f'Комментарий {number}' for number in range(5)
+                if f'Комментарий {number}'.encode() in page.content
+            )
+            match = re.search(r'\?cursor=([\w-]+)#comments">\s*Следующие',
+                              page.content.decode())
+            if match is None:
+                break
+            cursor = match.group(1)
+        self.assertEqual(
+            seen, [f'Комментарий {number}' for number in range(5)]
+        )
+
+    def test_comments_cached_until_new_comment(self):
+        """Блок комментариев не ходит в базу, пока не добавлен комментарий."""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any(
+            'posts_comment' in query['sql'] for query in queries
+        ))
+        Comment.objects.filter(post=self.post).update(text='Тихая правка')
+        self.assertNotContains(self.client.get(self.url), 'Тихая правка')
+        self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            data={'text': 'Свежий комментарий'},
+        )
+        self.assertContains(self.client.get(self.url), 'Тихая правка')
+
+    def test_comment_authors_selected_together(self):
+        """Авторы комментариев загружаются одним запросом со страницей."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        comment_queries = [
+            query for query in queries if 'posts_comment' in query['sql']
+        ]
+        self.assertEqual(len(comment_queries), 1)
+
+
+class TagViewTest(TestCase):
+    """Лента тега листается как лента группы и видит новые теги."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='tag_view_author')
+        posts = [
+            Post.objects.create(author=cls.author, text=f'Пост с тегом {n}')
+            for n in range(settings.QUANTITY_PAGINATE + 1)
+        ]
+        Tag.objects.attach_many((post, ['лента']) for post in posts)
+        cls.url = reverse('posts:tag_list', args=('лента',))
+
+    def setUp(self):
+        clear_caches()
+
+    def test_tag_feed_paginated(self):
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'posts/tag_list.html')
+        self.assertEqual(
+            len(response.context['page_obj']), settings.QUANTITY_PAGINATE
+        )
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_unknown_tag(self):
+        response = self.client.get(reverse('posts:tag_list', args=('нет',)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_new_tag_visible(self):
+        """Привязка тега сразу видна в закешированной ленте тега."""
+        self.client.get(self.url)
+        with run_on_commit():
+            post = Post.objects.create(
+                author=self.author, text='Свежий пост'
+            )
+            Tag.objects.attach(post, ['лента'])
+        self.assertContains(self.client.get(self.url), 'Свежий пост')
+
+    def test_post_detail_links_tags(self):
+        post = Post.objects.filter(author=self.author).first()
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertContains(response, f'href="{self.url}"')
+
+    def test_tag_with_slash(self):
+        """Тег с косой чертой открывается и не ломает страницу поста."""
+        post = Post.objects.create(author=self.author, text='Про C++')
+        Tag.objects.attach(post, ['C/C++'])
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        url = reverse('posts:tag_list', args=('c/c++',))
+        self.assertContains(response, f'href="{url}"')
+        self.assertContains(self.client.get(url), 'Про C++')
+
+
+class FeedCacheLockTest(TestCase):
+    """Пересчёт промаха кеша ленты выполняет только один запрос."""
+    def setUp(self):
+        clear_caches()
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return HttpResponse('страница')
+
+    def test_miss_renders_once(self):
+        """Промах рендерит страницу и снимает блокировку."""
+        first = cached_response('feed:test', self.render)
+        second = cached_response('feed:test', self.render)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.renders, 1)
+        self.assertIsNone(caches['posts'].get('feed:test:lock'))
+
+    @override_settings(FEED_CACHE_WAIT=0.1)
+    def test_waits_for_locked_page(self):
+        """Если страницу держит другой запрос, ждём и затем считаем сами."""
+        caches['posts'].add('feed:test:lock', 1)
+        response = cached_response('feed:test', self.render)
+        self.assertEqual(response.content, 'страница'.encode())
+        self.assertEqual(self.renders, 1)
+
+    def test_bump_repeats_after_commit(self):
+        """Поколение сдвигается сразу и ещё раз после коммита записи."""
+        before = feed_generations([index_scope()])
+        with run_on_commit():
+            bump_feeds([index_scope()])
+            bumped = feed_generations([index_scope()])
+            self.assertNotEqual(bumped, before)
+        self.assertNotEqual(feed_generations([index_scope()]), bumped)
+
+    def test_scope_keys_are_safe(self):
+        """Имя тега с пробелом не попадает в ключ кеша как есть."""
+        scope = tag_scope('два слова ' + 'x' * 250)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            with run_on_commit():
+                bump_feeds([scope])
+            self.assertEqual(len(feed_generations([scope])), 1)
+
+
+class ConditionalGetTest(TestCase):
+    """ETag и Last-Modified: повторный визит получает 304 без отрисовки."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='conditional')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.detail_url = reverse('posts:post_detail', args=(cls.post.pk,))
+
+    def setUp(self):
+        clear_caches()
+
+    def age_scope(self, scope):
+        """Последнее изменение области было минуту назад."""
+        caches['posts'].set(
+            scope_key(FEED_MODIFIED_KEY, scope), time.time() - 60, None
+        )
+
+    def test_feed_not_modified(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_new_post_changes_etag(self):
+        url = reverse('posts:profile', args=(self.author.username,))
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Новый пост')
+
+    def test_etag_depends_on_user(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_last_modified(self):
+        """Last-Modified отдаётся, когда с изменения прошла секунда."""
+        url = reverse('posts:index')
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        self.age_scope(index_scope())
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_post_detail_one_query(self):
+        self.age_scope(author_scope(self.author.username))
+        # Пост правили позже, чем менялась лента автора
+        updated = timezone.now() - timedelta(seconds=30)
+        Post.objects.filter(pk=self.post.pk).update(updated=updated)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(
+            response['Last-Modified'], http_date(updated.timestamp())
+        )
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.detail_url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_post_detail_etag_follows_csrf_token(self):
+        """После нового входа форма комментария не берётся из кеша браузера."""
+        self.client.force_login(self.author)
+        self.client.get(self.detail_url)
+        response = self.client.get(self.detail_url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(
+            self.detail_url, HTTP_IF_NONE_MATCH=etag
+        ).status_code, HTTPStatus.NOT_MODIFIED)
+        self.client.logout()
+        self.client.force_login(self.author)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_comment_changes_post_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий комментарий'
+        )
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Свежий комментарий')
+
+
+class SearchViewTest(TestCase):
+    """Поиск по постам через инвертированный индекс."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='search_author')
+        cls.cats = Post.objects.create(
+            author=cls.author, text='Кошки любят молоко. Кошки спят.'
+        )
+        cls.dogs = Post.objects.create(
+            author=cls.author, text='Собаки любят кошек и молоко'
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:index'), {'q': query, **params}
+        )
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_ranked(self):
+        """Находятся посты со всеми словами, частые вхождения выше."""
+        self.assertEqual(self.search('молоко'), [self.dogs.pk, self.cats.pk])
+        self.assertEqual(self.search('КОШКИ молоко'), [self.cats.pk])
+        self.assertEqual(self.search('жирафы'), [])
+
+    def test_search_reindexed_on_edit(self):
+        """Правка поста обновляет индекс."""
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('posts:post_edit', args=(self.dogs.pk,)),
+            data={'text': 'Теперь про жирафов'},
+        )
+        self.assertEqual(self.search('жирафов'), [self.dogs.pk])
+        self.assertEqual(self.search('собаки'), [])
+
+    def test_search_kept_without_text_change(self):
+        """Сохранение без правки текста не трогает индекс."""
+        post = Post.objects.get(pk=self.cats.pk)
+        post.group = None
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse(any(
+            'postsearchtoken' in query['sql'] for query in queries
+        ))
+        self.assertEqual(self.search('кошки молоко'), [self.cats.pk])
+
+    def test_search_paginated(self):
+        """Результаты поиска листаются с сохранением запроса."""
+        for i in range(settings.QUANTITY_PAGINATE):
+            Post.objects.create(author=self.author, text=f'молоко {i}')
+        response = self.client.get(reverse('posts:index'), {'q': 'молоко'})
+        self.assertContains(response, '?page=2&amp;q=')
+        self.assertEqual(len(self.search('молоко', page=2)), 2)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=2
+)
+class ThumbnailPipelineTest(TransactionTestCase):
+    """Миниатюры готовятся в фоне, лента не режет картинки."""
+    # Фоновым потокам нужны закоммиченные данные, поэтому
+    # здесь TransactionTestCase, а не TestCase
+
+    @classmethod
+    def tearDownClass(cls):
+        wait_thumbnails()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        clear_caches()
+        self.author = User.objects.create_user(username='thumb_author')
+        self.client.force_login(self.author)
+
+    def upload(self, name):
+        return SimpleUploadedFile(
+            name=name, content=SMALL_GIF, content_type='image/gif'
+        )
+
+    def card_image(self):
+        response = self.client.get(reverse('posts:index'))
+        return response.content.decode()
+
+    def test_thumbnails_ready_after_upload(self):
+        """После загрузки лента показывает готовую миниатюру."""
+        self.client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': self.upload('up.gif')},
+        )
+        wait_thumbnails()
+        with mock.patch.object(
+            default.engine, 'get_image', side_effect=AssertionError
+        ):
+            content = self.card_image()
+        self.assertIn('/media/cache/', content)
+        self.assertNotIn(settings.THUMBNAIL_PLACEHOLDER, content)
+
+    def test_placeholder_until_ready(self):
+        """Пока миниатюры нет, показывается заглушка, а не ресайз."""
+        with mock.patch('posts.signals.schedule_thumbnails'):
+            post = Post.objects.create(
+                author=self.author, text='Без миниатюры',
+                image=self.upload('late.gif'),
+            )
+        with mock.patch.object(
+            default.engine, 'get_image', side_effect=AssertionError
+        ), mock.patch('posts.thumbnails.schedule_thumbnails') as schedule:
+            content = self.card_image()
+        self.assertIn(settings.THUMBNAIL_PLACEHOLDER, content)
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args[0][0], post.image.name)
+        # Миниатюра готова - закешированная карточка с заглушкой сброшена
+        generate_thumbnails(post.image.name, settings.THUMBNAIL_GEOMETRIES)
+        content = self.card_image()
+        self.assertNotIn(settings.THUMBNAIL_PLACEHOLDER, content)
+
+    def large_upload(self, name):
+        file_obj = BytesIO()
+        Image.new('RGB', (1600, 900), (0, 128, 255)).save(file_obj, 'JPEG')
+        return SimpleUploadedFile(
+            name=name, content=file_obj.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_variants_in_srcset(self):
+        """Картинка режется на ширины и форматы, лента отдаёт srcset."""
+        self.client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая', 'image': self.large_upload('big.jpg')},
+        )
+        wait_thumbnails()
+        post = Post.objects.get()
+        variants = PostImageVariant.objects.filter(post=post)
+        self.assertEqual(
+            {(variant.format, variant.width) for variant in variants},
+            {
+                (image_format, width)
+                for image_format in variant_formats()
+                for width in settings.IMAGE_VARIANT_WIDTHS
+            },
+        )
+        content = self.card_image()
+        for variant in variants:
+            self.assertIn(f'{variant.image.url} {variant.width}w', content)
+
+    def test_variants_replaced_on_new_image(self):
+        """Новая картинка поста заменяет варианты прежней."""
+        post = Post.objects.create(
+            author=self.author, text='Первая', image=self.upload('old.gif')
+        )
+        wait_thumbnails()
+        self.assertTrue(post.image_variants.exists())
+        post.image = self.large_upload('new.jpg')
+        post.save()
+        wait_thumbnails()
+        self.assertTrue(all(
+            variant.image.name.endswith('.jpg') and variant.width >= 480
+            for variant in post.image_variants.all()
+        ))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR), THUMBNAIL_WORKERS=0
+)
+class ThumbnailPrefetchTest(TestCase):
+    """Метаданные миниатюр страницы загружаются одним запросом."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='prefetch_author')
+        for i in range(3):
+            post = Post.objects.create(
+                author=cls.author,
+                text=f'Пост {i}',
+                image=SimpleUploadedFile(
+                    name=f'prefetch{i}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            )
+            # TestCase не коммитит, и миниатюры после коммита
+            # не ставятся: готовим их сами
+            schedule_thumbnails(post.image.name)
+        # Без вариантов карточки показывают миниатюры sorl
+        PostImageVariant.objects.all().delete()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def kvstore_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '/media/cache/', count=3)
+        return [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+
+    def test_one_query_for_page(self):
+        """Промахи кеша по всей странице добираются одним запросом."""
+        clear_caches()
+        self.assertEqual(len(self.kvstore_queries()), 1)
+
+    def test_no_queries_with_warm_cache(self):
+        """С прогретым кешем база за миниатюрами не ходит."""
+        clear_caches()
+        self.kvstore_queries()
+        bump_feeds([index_scope()])
+        self.assertEqual(self.kvstore_queries(), [])
@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db import connection
+
+
+def clear_caches():
+    """Очищает все алиасы кеша: у каждого своё хранилище."""
+    for cache in caches.all():
+        cache.clear()
+
+
+@contextmanager
+def run_on_commit():
+    """Выполняет колбэки transaction.on_commit, добавленные в блоке.
+
+    TestCase не коммитит транзакцию, поэтому отложенные до коммита
+    сброс кеша лент и карточек в тестах иначе не выполнился бы.
+    """
+    start = len(connection.run_on_commit)
+    try:
+        yield
+    finally:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
@@ -0,0 +1,272 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.templatetags.static import static
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .cache import forget_post_card
+from .models import Post, PostImageVariant
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class PlaceholderImage(DummyImageFile):
+    """Заглушка вместо ещё не готовой миниатюры."""
+    is_placeholder = True
+
+    @property
+    def url(self):
+        return static(settings.THUMBNAIL_PLACEHOLDER)
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не режет картинки во время запроса.
+
+    Готовая миниатюра берётся из хранилища ключей sorl, а если её нет,
+    генерация ставится в очередь фоновых потоков и вместо миниатюры
+    возвращается заглушка.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_ or not settings.THUMBNAIL_WORKERS:
+            return self.render(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        cached = default.kvstore.get(
+            self.thumbnail_file(source, geometry_string, options)
+        )
+        if cached:
+            return cached
+        schedule_thumbnails(source.name, [(geometry_string, options)])
+        return PlaceholderImage(geometry_string)
+
+    def render(self, file_, geometry_string, **options):
+        """Возвращает миниатюру, при необходимости создавая её."""
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def thumbnail_file(self, source, geometry_string, options):
+        """Файл миниатюры, который вернул бы get_thumbnail, без обработки."""
+        options = dict(options)
+        # Те же параметры по умолчанию, что и в ThumbnailBackend,
+        # чтобы имя совпало с именем готовой миниатюры
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return ImageFile(
+            self._get_thumbnail_filename(source, geometry_string, options),
+            default.storage,
+        )
+
+
+class PrefetchingKVStore(KVStore):
+    """Хранилище метаданных миниатюр sorl: общий кеш, при промахе - база.
+
+    prefetch() загружает метаданные сразу для всей страницы: одним
+    get_many к кешу и одним запросом к базе для промахов. Загруженное
+    запоминается в потоке до начала следующего запроса.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    @property
+    def prefetched(self):
+        return self._local.__dict__.setdefault('values', {})
+
+    def forget_prefetched(self):
+        self._local.values = {}
+
+    def prefetch(self, image_files):
+        keys = [
+            key for key in {add_prefix(image.key) for image in image_files}
+            if key not in self.prefetched
+        ]
+        if not keys:
+            return
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            missed = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            # Отсутствие миниатюры тоже кешируем, как и KVStore
+            self.cache.set_many(missed, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(missed)
+        self.prefetched.update(values)
+
+    def _get_raw(self, key):
+        if key in self.prefetched:
+            value = self.prefetched[key]
+            return None if value == EMPTY_VALUE else value
+        return super()._get_raw(key)
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.prefetched.pop(key, None)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        for key in keys:
+            self.prefetched.pop(key, None)
+
+
+def prefetch_thumbnails(posts):
+    """Загружает метаданные миниатюр карточек постов одним обращением.
+
+    Посты, у которых уже есть варианты картинки (их нужно подгрузить
+    prefetch_related), миниатюры не используют и пропускаются.
+    """
+    backend = default.backend
+    files = []
+    for post in posts:
+        if not post.image or post.image_variants.all():
+            continue
+        source = ImageFile(post.image)
+        files.extend(
+            backend.thumbnail_file(source, geometry_string, options)
+            for geometry_string, options in settings.THUMBNAIL_GEOMETRIES
+        )
+    if files:
+        default.kvstore.prefetch(files)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def schedule_thumbnails(name, geometries=()):
+    """Ставит в очередь генерацию миниатюр картинки `name`.
+
+    Кроме переданных `geometries` готовятся все размеры
+    из settings.THUMBNAIL_GEOMETRIES. Картинка, которая уже
+    в очереди, повторно не добавляется.
+    """
+    if not name:
+        return
+    geometries = [*settings.THUMBNAIL_GEOMETRIES, *geometries]
+    if not settings.THUMBNAIL_WORKERS:
+        generate_thumbnails(name, geometries)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _get_executor().submit(_run, name, geometries)
+
+
+def wait_thumbnails():
+    """Дожидается, пока фоновые потоки подготовят все миниатюры."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _run(name, geometries):
+    try:
+        generate_thumbnails(name, geometries)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        # У потока пула своё соединение с базой, не держим его открытым
+        connection.close()
+
+
+def variant_formats():
+    """Форматы вариантов, которые умеют записывать Pillow и sorl."""
+    Image.init()
+    return [
+        image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+        if image_format in Image.SAVE and image_format in EXTENSIONS
+    ]
+
+
+def build_variants(name):
+    """Готовит варианты картинки для srcset.
+
+    Картинка не увеличивается, поэтому у маленьких оригиналов
+    несколько ширин дают один и тот же вариант - он берётся один раз.
+    """
+    variants = []
+    for image_format in variant_formats():
+        widths = set()
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            height = round(width * settings.IMAGE_VARIANT_ASPECT)
+            thumbnail = default.backend.render(
+                name, f'{width}x{height}',
+                crop='center', upscale=False, format=image_format,
+            )
+            if thumbnail.width in widths:
+                continue
+            widths.add(thumbnail.width)
+            variants.append(dict(
+                image=thumbnail.name,
+                format=image_format,
+                width=thumbnail.width,
+                height=thumbnail.height,
+                size=thumbnail.storage.size(thumbnail.name),
+            ))
+    return variants
+
+
+def render_thumbnails(name, geometries):
+    """Готовит миниатюры картинки и возвращает описания её вариантов."""
+    for geometry_string, options in geometries:
+        default.backend.render(name, geometry_string, **options)
+    return build_variants(name)
+
+
+def generate_thumbnails(name, geometries):
+    """Готовит миниатюры и варианты картинки постов.
+
+    После этого сбрасываются закешированные карточки постов
+    с этой картинкой, чтобы вместо заглушки показались миниатюры.
+    """
+    # Импорт здесь: signals сами ставят миниатюры в очередь
+    from .signals import bump_post_feeds
+
+    variants = render_thumbnails(name, geometries)
+    posts = list(Post.objects.filter(image=name).values_list(
+        'pk', 'updated', 'author_id', 'group_id'
+    ))
+    post_ids = [post_id for post_id, *_ in posts]
+    PostImageVariant.objects.filter(post_id__in=post_ids).delete()
+    PostImageVariant.objects.bulk_create([
+        PostImageVariant(post_id=post_id, **variant)
+        for post_id in post_ids
+        for variant in variants
+    ])
+    for post_id, updated, author_id, group_id in posts:
+        forget_post_card(post_id, updated)
+        bump_post_feeds(author_id, group_id)
@@ -7,6 +7,8 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    # В имени тега бывает косая черта (c/c++)
+    path('tags/<path:name>/', views.tag_posts, name='tag_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<post_id>/edit/', views.post_edit, name='post_edit'),
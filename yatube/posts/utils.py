@@ -1,9 +1,232 @@
+import base64
+import binascii
+from collections import OrderedDict
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
+def paginate(posts, request, cursor=None):
+    """Функция-паджинатор.
 
-def paginate(posts, request):
-    """Функция-паджинатор"""
+    По умолчанию используется постраничная навигация по номерам страниц.
+    Если `cursor=True` (или имя view перечислено в
+    settings.CURSOR_PAGINATE_VIEWS), используется курсорная навигация
+    по ключу (pub_date, id) без COUNT(*) и OFFSET.
+    """
+    if cursor is None:
+        match = getattr(request, 'resolver_match', None)
+        cursor = bool(match) and (
+            match.view_name in settings.CURSOR_PAGINATE_VIEWS
+        )
+    if cursor:
+        paginator = CursorPaginator(posts, settings.QUANTITY_PAGINATE)
+        return paginator.get_page(request.GET.get('cursor'))
     paginator = Paginator(posts, settings.QUANTITY_PAGINATE)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPaginator(Paginator):
+    """Курсорный (keyset) паджинатор.
+
+    Страница выбирается условием по ключу сортировки
+    `ordering` (по умолчанию `-pub_date, -pk`), поэтому запрос
+    идёт по индексу и не зависит от глубины страницы.
+    Общее количество записей не подсчитывается: страницы - обычные
+    объекты Page, у которых вместо номеров есть курсоры `next_cursor`
+    (более старые записи) и `previous_cursor` (более новые записи).
+    """
+    is_cursor = True
+    _num_pages = 1
+    _count = 0
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk')):
+        super().__init__(object_list, per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def get_page(self, cursor):
+        """Возвращает страницу по курсору; при ошибке - первую."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+    def page(self, cursor):
+        if not cursor:
+            return self._build_page(self._fetch(None, False), None, False)
+        backwards, values = self.decode_cursor(cursor)
+        rows = self._fetch(values, backwards)
+        if backwards and len(rows) <= self.per_page:
+            # Дошли до самых новых записей - показываем первую страницу
+            return self.page(None)
+        return self._build_page(rows, values, backwards)
+
+    def page_queryset(self, values=None, backwards=False):
+        """Запрос страницы после ключа `values` (и одной записи сверх)."""
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(self._reverse(name) for name in ordering)
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._position_filter(
+                values, backwards
+            ))
+        return queryset[:self.per_page + 1]
+
+    def _fetch(self, values, backwards):
+        return list(self.page_queryset(values, backwards))
+
+    def _build_page(self, rows, values, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1], False)
+            if values is not None and (has_more or not backwards):
+                previous_cursor = self.encode_cursor(rows[0], True)
+        # Номера страниц условные: паджинатор знает только,
+        # есть ли соседние страницы, этого хватает методам Page
+        number = 1 if previous_cursor is None else 2
+        self._num_pages = number + (next_cursor is not None)
+        self._count = 0
+        if rows:
+            self._count = (number - 1) * self.per_page + len(rows) + (
+                self.per_page if next_cursor is not None else 0
+            )
+        page = Page(rows, number, self)
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        return page
+
+    def _position_filter(self, values, backwards):
+        """Условие (a, b) < (x, y) в виде OR из AND-цепочек."""
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-') != backwards
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+            for prev_index in range(index):
+                step &= Q(**{self.fields[prev_index]: values[prev_index]})
+            condition |= step
+        return condition
+
+    @staticmethod
+    def _reverse(name):
+        return name[1:] if name.startswith('-') else '-' + name
+
+    def encode_cursor(self, obj, backwards):
+        parts = ['p' if backwards else 'n']
+        for name in self.fields:
+            value = getattr(obj, name)
+            parts.append(
+                value.isoformat() if hasattr(value, 'isoformat')
+                else str(value)
+            )
+        raw = '|'.join(parts).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        except (binascii.Error, UnicodeError, ValueError):
+            raise InvalidCursor(cursor)
+        parts = raw.split('|')
+        if len(parts) != len(self.fields) + 1 or parts[0] not in ('n', 'p'):
+            raise InvalidCursor(cursor)
+        values = []
+        model = self.object_list.model
+        for name, value in zip(self.fields, parts[1:]):
+            field = (
+                model._meta.pk if name == 'pk'
+                else model._meta.get_field(name)
+            )
+            try:
+                if field.get_internal_type() == 'DateTimeField':
+                    parsed = parse_datetime(value)
+                    if parsed is None:
+                        raise ValueError(value)
+                    values.append(parsed)
+                else:
+                    values.append(field.to_python(value))
+            except Exception:
+                raise InvalidCursor(cursor)
+        return parts[0] == 'p', values
+
+    @property
+    def count(self):
+        """Условное число записей, согласованное с номерами страниц.
+
+        Настоящее количество не считается (это COUNT(*)): учитываются
+        записи до текущей страницы, сама страница и, если есть
+        следующая, ещё одна полная страница. Этого хватает
+        Page.start_index() и Page.end_index().
+        """
+        return self._count
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    @property
+    def page_range(self):
+        return range(1, self._num_pages + 1)
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация JSON API на CursorPaginator.
+
+    Порядок задаёт атрибут view `cursor_ordering`
+    (по умолчанию от новых записей к старым).
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = CursorPaginator(
+            queryset,
+            api_settings.PAGE_SIZE,
+            ordering=getattr(view, 'cursor_ordering', ('-pub_date', '-pk')),
+        )
+        self.page = paginator.get_page(
+            request.query_params.get(self.cursor_query_param)
+        )
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.page.next_cursor)),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        if self.page.previous_cursor is None:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.get_link(self.page.previous_cursor)
@@ -1,28 +1,64 @@
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404
-from .models import Post, Group, Follow, User
+from django.template.loader import render_to_string
+from .models import (
+    AuthorStats, Post, Group, Follow, Tag, TimelineEntry, User
+)
 from .forms import PostForm, CommentForm
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
-from .utils import paginate
-from django.views.decorators.cache import cache_page
+from .search import search_posts
+from .thumbnails import prefetch_thumbnails
+from .utils import CursorPaginator, paginate
+from .cache import (
+    author_scope, cache_feed, comments_block_key, conditional_page,
+    feed_versions, group_scope, index_scope, page_digest, posts_cache,
+    tag_scope, timeline_pull_due
+)
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_feed(lambda: [index_scope()])
 def index(request):
     """Заглавная траница с выводом всех постов"""
-    posts = Post.objects.select_related('group', 'author')
+    keyword = request.GET.get('q', '').strip()
+    if keyword:
+        return search(request, keyword)
+    posts = Post.objects.feed()
     page_obj = paginate(posts, request)
+    prefetch_thumbnails(page_obj)
+    context = {
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/index.html', context)
+
+
+def search(request, keyword):
+    """Результаты поиска по постам на заглавной странице"""
+    page_obj = paginate(search_posts(keyword), request, cursor=False)
+    posts = Post.objects.feed().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
+        'keyword': keyword,
+        'page_query': '&' + urlencode({'q': keyword}),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_feed(lambda slug: [group_scope(slug)])
 def group_posts(request, slug):
     """Страница группы/сообщества с выводом всех постов (по группе)"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
+    posts = group.posts.feed()
     page_obj = paginate(posts, request)
+    prefetch_thumbnails(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -30,6 +66,22 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+# Правка поста сдвигает поколение заглавной ленты, но не лент его тегов,
+# поэтому страница тега зависит от обоих поколений
+@cache_feed(lambda name: [index_scope(), tag_scope(name)])
+def tag_posts(request, name):
+    """Страница тега с выводом всех постов с этим тегом"""
+    tag = get_object_or_404(Tag, name=name)
+    posts = Post.objects.feed().filter(tag_links__tag=tag)
+    page_obj = paginate(posts, request)
+    prefetch_thumbnails(page_obj)
+    context = {
+        'tag': tag,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/tag_list.html', context)
+
+
 @login_required
 def post_create(request):
     """Страница создания нового поста"""
@@ -41,7 +93,9 @@ def post_create(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # Пост и счётчики автора сохраняются одной транзакцией
+            with transaction.atomic():
+                post.save()
             return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -85,25 +139,96 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def conditional_post(view):
+    """ETag и Last-Modified страницы поста без её отрисовки.
+
+    Версию поста (updated) сдвигают правка и комментарии, поколение
+    ленты автора - его счётчики и готовые миниатюры. Проверка стоит
+    один запрос по первичному ключу.
+    """
+    @wraps(view)
+    def wrapper(request, post_id):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, post_id)
+        version = Post.objects.filter(pk=post_id).values_list(
+            'updated', 'author__username'
+        ).first()
+        if version is None:
+            return view(request, post_id)
+        updated, username = version
+        generations, modified = feed_versions([author_scope(username)])
+        versions = [updated.timestamp(), *generations]
+        modified = max(modified, updated.timestamp())
+        if request.user.is_authenticated:
+            # Вошедшему пользователю страница показывает форму комментария
+            # с CSRF-токеном, а токен меняется при каждом входе: он входит
+            # в ETag, а по одной дате Last-Modified ответа 304 не будет
+            versions.append(request.META.get('CSRF_COOKIE'))
+            modified = None
+        return conditional_page(
+            request,
+            page_digest(request, *versions),
+            modified,
+            lambda: view(request, post_id),
+        )
+    return wrapper
+
+
+@conditional_post
 def post_detail(request, post_id):
     """Страница просмотра отдельного поста по id"""
     form = CommentForm(request.POST or None)
     post = get_object_or_404(Post, pk=post_id)
     context = {
         'post': post,
-        'comments': post.comments.all(),
+        'author_stats': AuthorStats.objects.for_author(post.author),
+        'comments': render_comments(request, post),
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_paginator(post):
+    """Курсорный паджинатор комментариев поста, от старых к новым."""
+    comments = post.comments.select_related('author').only(
+        'text', 'pub_date', 'post', 'author__username'
+    )
+    return CursorPaginator(
+        comments, settings.COMMENTS_PER_PAGE, ordering=('pub_date', 'pk')
+    )
+
+
+def render_comments(request, post):
+    """Страница комментариев поста, отрисованная и закешированная.
+
+    Комментарии листаются курсором по (pub_date, id) от старых
+    к новым. Ключ кеша включает версию поста, которую сдвигает
+    каждый новый комментарий, поэтому add_comment сразу виден.
+    """
+    cursor = request.GET.get('cursor')
+    key = comments_block_key(post.pk, post.updated, cursor)
+    cache = posts_cache()
+    block = cache.get(key)
+    if block is None:
+        block = render_to_string(
+            'posts/includes/comments.html',
+            {'page_obj': comments_paginator(post).get_page(cursor)},
+        )
+        cache.set(key, block, settings.COMMENTS_CACHE_TIMEOUT)
+    return block
+
+
 @login_required
 def follow_index(request):
     """Страница просмотра постов авторов,
     на которых подписан текущий пользователь.
     """
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate(posts, request)
+    if timeline_pull_due(request.user.pk):
+        TimelineEntry.objects.pull_celebrities(request.user)
+    entries = TimelineEntry.objects.feed(request.user)
+    page_obj = paginate(entries, request)
+    page_obj.object_list = [entry.post for entry in page_obj]
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -115,10 +240,11 @@ def profile_follow(request, username):
     # Подписаться на автора
     following = get_object_or_404(User, username=username)
     if request.user.username != username:
-        Follow.objects.get_or_create(
-            user=request.user,
-            author=following
-        )
+        with transaction.atomic():
+            Follow.objects.get_or_create(
+                user=request.user,
+                author=following
+            )
         return redirect('posts:profile', username=username)
     return redirect('posts:profile', username=username)
 
@@ -137,21 +263,24 @@ def profile_unfollow(request, username):
     return redirect('posts:profile', username=username)
 
 
+@cache_feed(lambda username: [author_scope(username)])
 def profile(request, username):
     """Страница просмотра профайла автора с выводом всех постов (по автору)"""
     author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('group')
+    posts = author.posts.feed()
     page_obj = paginate(posts, request)
+    prefetch_thumbnails(page_obj)
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user,
         author=author,
+        is_deleted=False,
     ).exists()
-    followers = Follow.objects.filter(author=author, is_deleted=False)
-    followers_count = followers.count()
+    stats = AuthorStats.objects.for_author(author)
     context = {
         'author': author,
         'page_obj': page_obj,
         'following': following,
-        'followers_count': followers_count,
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
     }
     return render(request, 'posts/profile.html', context)
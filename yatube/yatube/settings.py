@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 from dotenv import load_dotenv
 
@@ -19,6 +20,9 @@ load_dotenv()
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Запуск тестов: manage.py test или pytest
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -28,7 +32,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True').lower() in ('1', 'true', 'yes')
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -54,10 +58,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
+    'rest_framework',
+    'rest_framework.authtoken',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,13 +71,63 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# debug_toolbar нужен только при разработке
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Замеры запросов (core/middleware.py): число и время SQL, кеш, время
+# ответа. Строки пишутся в лог yatube.metrics, счётчики отдаёт /metrics/
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'True').lower() in (
+    '1', 'true', 'yes'
+)
+# Бюджет SQL-запросов на запрос к view; превышение логируется как WARNING.
+# QUERY_BUDGETS задаёт бюджет отдельных view по их имени. Бюджеты лент -
+# замер страницы без кеша для вошедшего пользователя при готовых
+# миниатюрах (posts/tests/test_benchmark.py, QueryBudgetTest)
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 30))
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:group_list': 6,
+    'posts:profile': 8,
+    'posts:follow_index': 5,
+    'posts:post_detail': 10,
+    # При THUMBNAIL_WORKERS=0 миниатюры и варианты готовятся в запросе
+    'posts:post_create': 80,
+    'posts:post_edit': 80,
+    # Импорт: запросов на пачку постов постоянно, но пачек несколько
+    'api:post-import-posts': None,
+}
+# С каких адресов можно читать /metrics/
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', ','.join(INTERNAL_IPS)
+).split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.metrics': {
+            'handlers': ['console'],
+            # INFO - строка на каждый запрос, WARNING - только превышения.
+            # Тесты нарочно строят страницы с холодным кешем: не шумим
+            'level': os.getenv(
+                'METRICS_LOG_LEVEL', 'ERROR' if TESTING else 'WARNING'
+            ),
+            'propagate': False,
+        },
+    },
+}
+
 ROOT_URLCONF = 'yatube.urls'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -100,12 +156,41 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Настройки берутся из окружения; по умолчанию - sqlite рядом с проектом.
+# DB_ENGINE: django.db.backends.sqlite3 | django.db.backends.postgresql
+# DB_CONN_MAX_AGE: сколько секунд держать соединение между запросами
+# DB_POOL=pgbouncer: соединения идут через внешний пул pgbouncer
+# в режиме transaction: соединения держит пул, а не Django, поэтому
+# каждый запрос открывает своё; серверные курсоры при этом отключаются
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': DB_ENGINE,
+        'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {},
     }
 }
+if os.getenv('DB_POOL') == 'pgbouncer':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Настройка sqlite для параллельной записи (см. core/db.py):
+# WAL не блокирует читателей на время записи, busy_timeout заставляет
+# писателя ждать освобождения блокировки вместо "database is locked",
+# synchronous=NORMAL в режиме WAL не теряет целостность базы
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 20))
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': SQLITE_BUSY_TIMEOUT * 1000,
+}
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS']['timeout'] = SQLITE_BUSY_TIMEOUT
 
 
 # Password validation
@@ -151,6 +236,46 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 QUANTITY_POST = 10
 QUANTITY_PAGINATE = 10
 QUANTITY_SYMBOL = 15
+# Длина отрывка текста поста, который показывает лента
+POST_EXCERPT_LENGTH = 350
+# Комментарии под постом листаются курсором по дате, от старых к новым
+COMMENTS_PER_PAGE = 50
+# Ленты, которые листаются курсором (pub_date, id) вместо номеров страниц
+CURSOR_PAGINATE_VIEWS = (
+    'posts:follow_index',
+)
+# Лента подписок: посты авторов, у которых подписчиков больше лимита,
+# не раскладываются по лентам при публикации, а подтягиваются при чтении
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 1000))
+# Как часто (в секундах) подтягивать их посты в ленту одного читателя
+TIMELINE_PULL_INTERVAL = 60
+# Сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL = 200
+TIMELINE_BATCH_SIZE = 1000
+# Поиск по постам: сколько результатов ранжировать и размер пачки индекса
+SEARCH_MAX_RESULTS = 1000
+SEARCH_BATCH_SIZE = 1000
+# Сколько связей поста с тегами создавать одним INSERT
+TAG_BATCH_SIZE = 1000
+# Импорт постов (posts/importing.py): сколько постов сохранять одной
+# транзакцией и сколько записей принимать за один запрос к API
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_RECORDS = 1000
+# Выгрузка (posts/exporting.py): сколько записей читать одним запросом
+EXPORT_CHUNK_SIZE = 2000
+
+# JSON API (posts/api.py): курсорные страницы того же размера, что и ленты
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ),
+    'DEFAULT_PERMISSION_CLASSES': (
+        'rest_framework.permissions.IsAuthenticatedOrReadOnly',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'posts.utils.KeysetPagination',
+    'PAGE_SIZE': QUANTITY_PAGINATE,
+}
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -167,8 +292,106 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Ограничения на загружаемые картинки постов: размер файла в байтах,
+# число пикселей (защита от "бомб" распаковки) и допустимые форматы.
+# Картинки больше IMAGE_MAX_DIMENSION по стороне уменьшаются при загрузке
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 2 ** 20))
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_MAX_DIMENSION = 2560
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+IMAGE_JPEG_QUALITY = 85
+
+# Миниатюры картинок постов готовятся фоновыми потоками при загрузке,
+# пока их нет - шаблон показывает заглушку THUMBNAIL_PLACEHOLDER.
+# THUMBNAIL_WORKERS=0 - готовить миниатюры сразу, в том же потоке
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+# Метаданные миниатюр - в общем кеше, база только при промахе
+THUMBNAIL_KVSTORE = 'posts.thumbnails.PrefetchingKVStore'
+THUMBNAIL_CACHE = 'thumbnails'
+# В тестах миниатюры готовятся сразу: фоновые потоки писали бы
+# во временную папку медиа теста уже после её удаления
+THUMBNAIL_WORKERS = int(
+    os.getenv('THUMBNAIL_WORKERS', 0 if TESTING else 2)
+)
+THUMBNAIL_PLACEHOLDER = 'img/placeholder.svg'
+# Размеры миниатюр из шаблонов: (геометрия, параметры sorl)
+THUMBNAIL_GEOMETRIES = (
+    ('960x550', {'crop': 'center', 'upscale': True}),
+)
+# Варианты картинки для srcset: ширины и форматы в порядке предпочтения.
+# Форматы, которые не умеет писать установленный Pillow, пропускаются
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_FORMATS = ('WEBP', 'JPEG')
+IMAGE_VARIANT_ASPECT = 550 / 960
+# Ширина картинки на странице - для атрибута sizes и src по умолчанию
+IMAGE_VARIANT_SIZES = '(max-width: 960px) 100vw, 960px'
+IMAGE_VARIANT_DEFAULT_WIDTH = 960
+
+# Кеш выбирается переменной окружения CACHE_BACKEND:
+# locmem - свой у каждого процесса (для разработки),
+# file - общий для процессов на одной машине,
+# redis - общий для всех машин (пакет django-redis),
+# memcached - общий для всех машин (нужен пакет python-memcached)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'yatube'),
+    'file': (
+        'django.core.cache.backends.filebased.FileBasedCache',
+        os.path.join(BASE_DIR, 'cache'),
+    ),
+    'redis': ('django_redis.cache.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'memcached': (
+        'django.core.cache.backends.memcached.MemcachedCache',
+        '127.0.0.1:11211',
+    ),
+}
+CACHE_BACKEND_NAME = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[CACHE_BACKEND_NAME]
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', CACHE_LOCATION)
+CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'yatube')
+# Сколько записей держит каждый алиас в locmem и file; сервера
+# redis и memcached вытесняют записи сами
+CACHE_MAX_ENTRIES = {
+    'default': 1000,
+    'posts': 10000,
+    'thumbnails': 10000,
+}
+
+
+def cache_alias(namespace):
+    """Алиас кеша со своим префиксом ключей для приложения.
+
+    У locmem и file у каждого алиаса своё хранилище и свой
+    предел записей: clear() одного алиаса и вытеснение не задевают
+    другие. Сервер redis или memcached алиасы делят, ключи
+    разделяет префикс.
+    """
+    alias = {
+        'BACKEND': 'core.cache.InstrumentedCache',
+        'INNER_BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': f'{CACHE_KEY_PREFIX}:{namespace}',
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
     }
+    if CACHE_BACKEND_NAME == 'locmem':
+        alias['LOCATION'] = f'{CACHE_LOCATION}:{namespace}'
+    elif CACHE_BACKEND_NAME == 'file':
+        alias['LOCATION'] = os.path.join(CACHE_LOCATION, namespace)
+    if CACHE_BACKEND_NAME in ('locmem', 'file'):
+        alias['OPTIONS'] = {'MAX_ENTRIES': CACHE_MAX_ENTRIES[namespace]}
+    return alias
+
+
+CACHES = {
+    namespace: cache_alias(namespace) for namespace in CACHE_MAX_ENTRIES
 }
+# Алиас кеша приложения posts: ленты, карточки постов, поколения лент
+POSTS_CACHE = 'posts'
+# Страницы лент живут долго: их ключи меняются с поколением ленты
+FEED_CACHE_TIMEOUT = 60 * 60
+# Блоки комментариев тоже: ключ меняется с версией поста
+COMMENTS_CACHE_TIMEOUT = 60 * 60
+# Сколько последних комментариев показывать в карточке поста в ленте
+FEED_LATEST_COMMENTS = int(os.getenv('FEED_LATEST_COMMENTS', 0))
+# Сколько держится блокировка пересчёта страницы и сколько её ждут
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_WAIT = 2
@@ -18,12 +18,20 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from rest_framework.authtoken.views import obtain_auth_token
+
+from core.views import metrics
+from posts.api import router as api_router
+
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
-    path('admin/', admin.site.urls)
+    path('admin/', admin.site.urls),
+    path('metrics/', metrics, name='metrics'),
+    path('api/v1/', include((api_router.urls, 'api'))),
+    path('api/v1/auth/token/', obtain_auth_token, name='api_token'),
 ]
 
 handler404 = 'core.views.page_not_found'